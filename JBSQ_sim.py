@@ -1,10 +1,9 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
 from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
 
@@ -14,13 +13,13 @@ class JBSQCore(Core):
     """Core which processes requests to completion"""
     @staticmethod
     def init_params():
-        JBSQCore.comm_delay = NicSimulator.config['comm_delay'].next()
+        JBSQCore.comm_delay = next(NicSimulator.config['comm_delay'])
 
     def start(self):
         while not NicSimulator.complete:
             msg = yield self.queue.get()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            yield self.env.timeout(msg.service_time)
+            yield from self.execute(msg)
             self.logger.log('Finished Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
             # asynchronously notify dispatcher that this core is available for another msg
             self.env.process(self.notify_dispatcher(msg))
@@ -28,18 +27,21 @@ class JBSQCore(Core):
     def notify_dispatcher(self, msg):
         yield self.env.timeout(JBSQCore.comm_delay)
         self.dispatcher.idle_cores.put(self)
-        NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-        NicSimulator.request_cnt += 1
-        NicSimulator.check_done(self.env.now)
+        NicSimulator.request_done(msg, self.env.now)
+
+    # override base class method
+    def dropped(self, msg):
+        # the dropped msg frees up one of this core's slots
+        self.dispatcher.idle_cores.put(self)
 
 class JBSQDispatcher(Dispatcher):
     """Dispatch a bounded number of requests to each core"""
     @staticmethod
     def init_params():
-        JBSQDispatcher.queue_bound = NicSimulator.config['queue_bound'].next()
+        JBSQDispatcher.queue_bound = next(NicSimulator.config['queue_bound'])
 
     def __init__(self, *args):
-        super(JBSQDispatcher, self).__init__(*args)
+        super().__init__(*args)
         self.idle_cores = simpy.Store(self.env)
 
     # override base class method
@@ -1,56 +1,33 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
-from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
+from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, PreemptiveRequest, preemptive_queue, run_nic_sim
 
 Logger.debug = False
 
-class PREJBSQRequest(Request):
-    """Custom request class for the preemptive JBSQ scheduling policy"""
-    def __init__(self, *args):
-        super(PREJBSQRequest, self).__init__(*args)
-        self.update_service_time()
-
-    @staticmethod
-    def init_params():
-        PREJBSQRequest.preemp = NicSimulator.config['preemp'].next()
-
-    def update_service_time(self):
-        # runtime is how long to run the request for at the core before it is preempted
-        # service_time is the remaining service time for the request
-        if self.service_time > PREJBSQRequest.preemp:
-            self.runtime = PREJBSQRequest.preemp
-            self.service_time -= PREJBSQRequest.preemp
-        else:
-            self.runtime = self.service_time
-            self.service_time = 0
-
 class PREJBSQCore(Core):
     """Core which processes requests until preempted"""
     @staticmethod
     def init_params():
-        PREJBSQCore.comm_delay = NicSimulator.config['comm_delay'].next()
+        PREJBSQCore.comm_delay = next(NicSimulator.config['comm_delay'])
 
     def start(self):
         while not NicSimulator.complete:
             msg = yield self.queue.get()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            # service the request at least once
-            yield self.env.timeout(msg.runtime)
-            msg.update_service_time()
-            # continue servicing the request while the dispatcher queue is empty and local queue is empty
-            while len(self.dispatcher.queue.items) == 0 and len(self.queue.items) == 0 and msg.runtime > 0:
-                yield self.env.timeout(msg.runtime)
-                msg.update_service_time()
+            # service the request until it completes or another request is waiting at the dispatcher or locally
+            yield from self.serve_preemptive(msg, self.busy, [self.dispatcher.queue, self.queue])
             self.logger.log('Stopped Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
             # asynchronously notify dispatcher that this core is available for another msg
             self.env.process(self.notify_dispatcher(msg))
 
+    def busy(self):
+        return len(self.dispatcher.queue.items) > 0 or len(self.queue.items) > 0
+
     def notify_dispatcher(self, msg):
         yield self.env.timeout(PREJBSQCore.comm_delay)
         self.dispatcher.idle_cores.put(self)
@@ -58,18 +35,22 @@ class PREJBSQCore(Core):
             # the request needs to be processed for longer
             self.dispatcher.queue.put(msg)
         else:
-            NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-            NicSimulator.request_cnt += 1
-            NicSimulator.check_done(self.env.now)
+            NicSimulator.request_done(msg, self.env.now)
+
+    # override base class method
+    def dropped(self, msg):
+        # the dropped msg frees up one of this core's slots
+        self.dispatcher.idle_cores.put(self)
 
 class PREJBSQDispatcher(Dispatcher):
     """Centralized dispatcher that waits until a core becomes available"""
     @staticmethod
     def init_params():
-        PREJBSQDispatcher.queue_bound = NicSimulator.config['queue_bound'].next()
+        PREJBSQDispatcher.queue_bound = next(NicSimulator.config['queue_bound'])
 
     def __init__(self, *args):
-        super(PREJBSQDispatcher, self).__init__(*args)
+        super().__init__(*args)
+        self.queue = preemptive_queue(self.env)
         self.idle_cores = simpy.Store(self.env)
 
     # override base class method
@@ -93,7 +74,7 @@ class PREJBSQDispatcher(Dispatcher):
 def main():
     args = cmd_parser.parse_args()
     # Run the simulation
-    run_nic_sim(args, PREJBSQCore, PREJBSQDispatcher, PREJBSQRequest)
+    run_nic_sim(args, PREJBSQCore, PREJBSQDispatcher, PreemptiveRequest)
 
 if __name__ == '__main__':
     main()
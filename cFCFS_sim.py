@@ -1,10 +1,9 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
 from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
 
@@ -13,31 +12,29 @@ Logger.debug = False
 class cFCFSCore(Core):
     """Core which processes requests to completion"""
     def __init__(self, *args):
-        super(cFCFSCore, self).__init__(*args)
+        super().__init__(*args)
         # add this core to the list of idle cores
         self.dispatcher.idle_cores.put(self)
 
     @staticmethod
     def init_params():
-        cFCFSCore.comm_delay = NicSimulator.config['comm_delay'].next()
+        cFCFSCore.comm_delay = next(NicSimulator.config['comm_delay'])
 
     def start(self):
         while not NicSimulator.complete:
             msg = yield self.queue.get()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            yield self.env.timeout(msg.service_time)
+            yield from self.execute(msg)
             self.logger.log('Finished Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
             # add this core to the list of idle cores
             yield self.env.timeout(cFCFSCore.comm_delay)
             self.dispatcher.idle_cores.put(self)
-            NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-            NicSimulator.request_cnt += 1
-            NicSimulator.check_done(self.env.now)
+            NicSimulator.request_done(msg, self.env.now)
 
 class cFCFSDispatcher(Dispatcher):
     """Randomly dispatch requests to cores"""
     def __init__(self, *args):
-        super(cFCFSDispatcher, self).__init__(*args)
+        super().__init__(*args)
         self.idle_cores = simpy.Store(self.env)
 
     def start(self):
@@ -1,57 +1,31 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
-from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
+from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, PreemptiveRequest, preemptive_queue, run_nic_sim
 
 Logger.debug = False
 
-class cPRERequest(Request):
-    """Custom request class for the centralized preemptive scheduling policy"""
-    def __init__(self, *args):
-        super(cPRERequest, self).__init__(*args)
-        self.update_service_time()
-
-    @staticmethod
-    def init_params():
-        cPRERequest.preemp = NicSimulator.config['preemp'].next()
-
-    def update_service_time(self):
-        # runtime is how long to run the request for at the core before it is preempted
-        # service_time is the remaining service time for the request
-        if self.service_time > cPRERequest.preemp:
-            self.runtime = cPRERequest.preemp
-            self.service_time -= cPRERequest.preemp
-        else:
-            self.runtime = self.service_time
-            self.service_time = 0
-
 class cPRECore(Core):
     """Core which processes requests to completion"""
     def __init__(self, *args):
-        super(cPRECore, self).__init__(*args)
+        super().__init__(*args)
         # add this core to the list of idle cores
         self.dispatcher.idle_cores.put(self)
 
     @staticmethod
     def init_params():
-        cPRECore.comm_delay = NicSimulator.config['comm_delay'].next()
+        cPRECore.comm_delay = next(NicSimulator.config['comm_delay'])
 
     def start(self):
         while not NicSimulator.complete:
             msg = yield self.queue.get()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            # service the request at least once
-            yield self.env.timeout(msg.runtime)
-            msg.update_service_time()
-            # continue servicing the request while the dispatcher queue is empty
-            while len(self.dispatcher.queue.items) == 0 and msg.runtime > 0:
-                yield self.env.timeout(msg.runtime)
-                msg.update_service_time()
+            # service the request until it completes or another request is waiting at the dispatcher
+            yield from self.serve_preemptive(msg, self.dispatcher_busy, [self.dispatcher.queue])
             self.logger.log('Stopped Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
             # add this core to the list of idle cores
             yield self.env.timeout(cPRECore.comm_delay)
@@ -60,14 +34,16 @@ class cPRECore(Core):
                 # the request needs to be processed for longer
                 self.dispatcher.queue.put(msg)
             else:
-                NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-                NicSimulator.request_cnt += 1
-                NicSimulator.check_done(self.env.now)
+                NicSimulator.request_done(msg, self.env.now)
+
+    def dispatcher_busy(self):
+        return len(self.dispatcher.queue.items) > 0
 
 class cPREDispatcher(Dispatcher):
     """Centralized dispatcher that waits until a core becomes available"""
     def __init__(self, *args):
-        super(cPREDispatcher, self).__init__(*args)
+        super().__init__(*args)
+        self.queue = preemptive_queue(self.env)
         self.idle_cores = simpy.Store(self.env)
 
     def start(self):
@@ -83,7 +59,7 @@ class cPREDispatcher(Dispatcher):
 def main():
     args = cmd_parser.parse_args()
     # Run the simulation
-    run_nic_sim(args, cPRECore, cPREDispatcher, cPRERequest)
+    run_nic_sim(args, cPRECore, cPREDispatcher, PreemptiveRequest)
 
 if __name__ == '__main__':
     main()
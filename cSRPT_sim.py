@@ -1,19 +1,18 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
-from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
+from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, WatchedPriorityStore, run_nic_sim
 
 Logger.debug = False
 
 class cSRPTRequest(Request):
     """Custom request class for centralized SRPT scheduling policy"""
     def __init__(self, *args):
-        super(cSRPTRequest, self).__init__(*args)
+        super().__init__(*args)
 
     def __lt__(self, other):
         """Highest priority element is the one with the smallest service time"""
@@ -22,33 +21,31 @@ class cSRPTRequest(Request):
 class cSRPTCore(Core):
     """Core which processes requests to completion"""
     def __init__(self, *args):
-        super(cSRPTCore, self).__init__(*args)
+        super().__init__(*args)
         # add this core to the list of idle cores
         self.dispatcher.idle_cores.put(self)
 
     @staticmethod
     def init_params():
-        cSRPTCore.comm_delay = NicSimulator.config['comm_delay'].next()
+        cSRPTCore.comm_delay = next(NicSimulator.config['comm_delay'])
 
     def start(self):
         while not NicSimulator.complete:
             msg = yield self.queue.get()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            yield self.env.timeout(msg.service_time)
+            yield from self.execute(msg)
             self.logger.log('Finished Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
             # add this core to the list of idle cores
             yield self.env.timeout(cSRPTCore.comm_delay)
             self.dispatcher.idle_cores.put(self)
-            NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-            NicSimulator.request_cnt += 1
-            NicSimulator.check_done(self.env.now)
+            NicSimulator.request_done(msg, self.env.now)
 
 class cSRPTDispatcher(Dispatcher):
     """Use priority queue to schedule requests"""
     def __init__(self, *args):
-        super(cSRPTDispatcher, self).__init__(*args)
+        super().__init__(*args)
         # override queue attribute with a priority queue
-        self.queue = simpy.PriorityStore(self.env)
+        self.queue = WatchedPriorityStore(self.env)
         self.idle_cores = simpy.Store(self.env)
 
     def start(self):
@@ -1,10 +1,9 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
 import pandas as pd
 import numpy as np
-import random
 
 from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, run_nic_sim
 
@@ -14,13 +13,11 @@ class dFCFSCore(Core):
     """Core which processes requests to completion"""
     def start(self):
         while not NicSimulator.complete:
-            msg = yield self.queue.get()
+            msg = yield self.get_request()
             self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            yield self.env.timeout(msg.service_time)
+            yield from self.execute(msg)
             self.logger.log('Finished Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
-            NicSimulator.completion_times['all'].append(self.env.now - msg.start_time)
-            NicSimulator.request_cnt += 1
-            NicSimulator.check_done(self.env.now)
+            NicSimulator.request_done(msg, self.env.now)
 
 class dFCFSDispatcher(Dispatcher):
     """Randomly dispatch requests to cores"""
@@ -29,7 +26,7 @@ class dFCFSDispatcher(Dispatcher):
             msg = yield self.queue.get()
             self.logger.log('Dispatching msg\n\t"{}"'.format(str(msg)))
             # Pick a random core
-            c = random.choice(self.cores)
+            c = self.rng.choice(self.cores)
             # put the request in the core's queue
             c.queue.put(msg)
 
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import argparse
+import simpy
+import pandas as pd
+import numpy as np
+import sys
+
+from nic_sim_lib import cmd_parser, Request, Core, Dispatcher, Logger, NicSimulator, CoreLoadIndex, get_param, run_nic_sim
+
+Logger.debug = False
+
+class dJSQCore(Core):
+    """Core which processes requests to completion"""
+    @staticmethod
+    def init_params():
+        dJSQCore.comm_delay = next(NicSimulator.config['comm_delay'])
+
+    def start(self):
+        while not NicSimulator.complete:
+            msg = yield self.queue.get()
+            self.logger.log('Received msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
+            yield from self.execute(msg)
+            self.logger.log('Finished Processing msg at core {}:\n\t"{}"'.format(self.ID, str(msg)))
+            # asynchronously notify dispatcher that this core has one less outstanding msg
+            self.env.process(self.notify_dispatcher(msg))
+
+    def notify_dispatcher(self, msg):
+        yield self.env.timeout(dJSQCore.comm_delay)
+        self.dispatcher.load_index.decrement(self)
+        NicSimulator.request_done(msg, self.env.now)
+
+    # override base class method
+    def dropped(self, msg):
+        # the dropped msg no longer counts against this core
+        self.dispatcher.load_index.decrement(self)
+
+class dJSQDispatcher(Dispatcher):
+    """Dispatch requests to core-local queues based on the number of outstanding requests at each core.
+    Supported policies:
+      - random : pick a core uniformly at random
+      - pod    : power-of-d choices (d = dispatch_d, default 2), pick the least loaded of d randomly sampled cores
+      - jsqd   : power-of-d choices with memory, also consider the core picked for the previous msg
+      - jsq    : join the shortest queue, pick one of the least loaded cores
+      - jiq    : join the idle queue, pick an idle core if there is one, otherwise a random core
+    """
+    policies = ['random', 'pod', 'jsqd', 'jsq', 'jiq']
+
+    @staticmethod
+    def init_params():
+        dJSQDispatcher.policy = next(NicSimulator.config['dispatch_policy'])
+        if dJSQDispatcher.policy not in dJSQDispatcher.policies:
+            print('ERROR: Unsupported dispatch_policy: {}'.format(dJSQDispatcher.policy))
+            sys.exit(1)
+        dJSQDispatcher.d = get_param('dispatch_d', 2)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.load_index = None
+        self.last_core = None
+
+    # override base class method
+    def add_cores(self, cores):
+        self.cores += cores
+        self.load_index = CoreLoadIndex(self.cores, self.rng)
+
+    def pick_core(self):
+        load = self.load_index.load
+        if dJSQDispatcher.policy == 'random':
+            return self.rng.choice(self.cores)
+        elif dJSQDispatcher.policy == 'pod':
+            return min(self.rng.sample(self.cores, min(dJSQDispatcher.d, len(self.cores))), key=lambda c: load[c.ID])
+        elif dJSQDispatcher.policy == 'jsqd':
+            candidates = self.rng.sample(self.cores, min(dJSQDispatcher.d, len(self.cores)))
+            if self.last_core is not None:
+                candidates.append(self.last_core)
+            self.last_core = min(candidates, key=lambda c: load[c.ID])
+            return self.last_core
+        elif dJSQDispatcher.policy == 'jsq':
+            return self.load_index.least_loaded()
+        elif dJSQDispatcher.policy == 'jiq':
+            idle = self.load_index.idle_cores()
+            return self.rng.choice(idle) if len(idle) > 0 else self.rng.choice(self.cores)
+
+    def start(self):
+        while not NicSimulator.complete:
+            # wait for a msg to arrive
+            msg = yield self.queue.get()
+            core = self.pick_core()
+            self.logger.log('Dispatching msg to core {}:\n\t"{}"'.format(core.ID, str(msg)))
+            # put the request in the core's queue
+            self.load_index.increment(core)
+            core.queue.put(msg)
+
+def main():
+    args = cmd_parser.parse_args()
+    # Run the simulation
+    run_nic_sim(args, dJSQCore, dJSQDispatcher)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import argparse
 import simpy
@@ -6,14 +6,25 @@ import pandas as pd
 import numpy as np
 import sys, os
 import abc
-import random
 import json
+import shutil
+import zlib
+import collections
+import time
+import heapq
+import sqlite3
+import cProfile
 
 # default cmdline args
 cmd_parser = argparse.ArgumentParser()
 cmd_parser.add_argument('--config', type=str, help='JSON config file to control the simulations', required=True)
+cmd_parser.add_argument('--progress', type=float, default=0, help='Report progress to stderr every PROGRESS seconds (0 to disable)')
+cmd_parser.add_argument('--progress-file', type=str, default=None, help='Also write the latest progress report to this JSON file')
+cmd_parser.add_argument('--results-db', type=str, default=None, help='Record the parameters and summary metrics of every run in this SQLite catalog')
+cmd_parser.add_argument('--profile', action='store_true', help='Report the wall time and events of every simulator component for each run')
+cmd_parser.add_argument('--cprofile', action='store_true', help='Also write cProfile stats for each run (cprofile.prof)')
 
-class Logger(object):
+class Logger:
     debug = False
     def __init__(self, env):
         self.env = env
@@ -24,13 +35,65 @@ class Logger(object):
 
     def log(self, s):
         if Logger.debug:
-            print '{}: {}'.format(self.env.now, s)
+            print('{}: {}'.format(self.env.now, s))
 
 
-class Request(object):
+class RandomStream:
+    """Independent stream of random numbers for one simulator component. Uniform draws are taken
+    from the underlying numpy Generator in blocks to keep the cost per draw low, and components
+    that need many samples from one distribution draw them from the generator directly.
+    """
+    def __init__(self, generator, block_size=4096):
+        self.generator = generator
+        self.block_size = block_size
+        self.block = []
+        self.idx = 0
+
+    def random(self):
+        if self.idx == len(self.block):
+            self.block = self.generator.random(self.block_size).tolist()
+            self.idx = 0
+        u = self.block[self.idx]
+        self.idx += 1
+        return u
+
+    def choice(self, seq):
+        return seq[int(self.random()*len(seq))]
+
+    def sample(self, seq, k):
+        """k distinct elements of seq in random order (k is expected to be much smaller than len(seq)).
+        The order matters to callers that break ties by taking the first of the sampled elements.
+        """
+        if k >= len(seq):
+            # shuffle the whole sequence
+            shuffled = list(seq)
+            for i in range(len(shuffled) - 1, 0, -1):
+                j = int(self.random()*(i + 1))
+                shuffled[i], shuffled[j] = shuffled[j], shuffled[i]
+            return shuffled
+        seen = set()
+        picked = []
+        while len(picked) < k:
+            i = int(self.random()*len(seq))
+            if i not in seen:
+                seen.add(i)
+                picked.append(seq[i])
+        return picked
+
+class Request:
     """This class represents a request to be scheduled/executed on a core 
     """
     count = 0
+    # phase of the arrival process the request arrived in (see ArrivalProcess)
+    phase = None
+    # closed-loop client that sent the request and the event that notifies it of completion
+    client = None
+    reply = None
+    # bytes to DMA over the PCIe link before the request can be processed, and bytes the core
+    # streams from memory while processing it (see SharedLink)
+    dma_bytes = 0
+    mem_bytes = 0
+    fetched = False
     def __init__(self, service_time, start_time):
         self.start_time = start_time
         self.service_time = service_time
@@ -44,15 +107,282 @@ class Request(object):
     def __str__(self):
         return "Request: service_time={}".format(self.service_time)
 
-class Core(object):
+class QueueCounter:
+    """Total number of items held by a group of queues"""
+    def __init__(self):
+        self.count = 0
+
+class WatchedStore(simpy.Store):
+    """Store that lets processes wait for the next item to be put into it.
+    The store can be bounded (see bound) to model a fixed depth ring, in which case requests are
+    dropped when it is full rather than blocking the put.
+    """
+    drop_policies = ['tail', 'head']
+
+    def __init__(self, env, capacity=float('inf')):
+        super().__init__(env, capacity)
+        self.put_watchers = []
+        self.limit = float('inf')
+        self.drop_policy = 'tail'
+        self.drop_listener = None
+
+    def bound(self, limit, drop_policy='tail', listener=None):
+        """Hold at most limit requests. When a request is put into the full store:
+          - tail : the arriving request is dropped
+          - head : the oldest waiting request is dropped to make room for it
+        listener(request) is called for every request dropped from this store.
+        """
+        if drop_policy not in WatchedStore.drop_policies:
+            print('ERROR: Unsupported drop_policy: {}'.format(drop_policy))
+            sys.exit(1)
+        self.limit = limit
+        self.drop_policy = drop_policy
+        self.drop_listener = listener
+
+    def pop_oldest(self):
+        return self.items.pop(0)
+
+    def drop(self, item, reason):
+        if self.drop_listener is not None:
+            self.drop_listener(item)
+        NicSimulator.request_dropped(item, self._env.now, reason)
+
+    def wait_put(self, event=None):
+        """Event which is triggered the next time an item is put into the store. The same event may
+        be passed to several stores to wait for a put into any of them.
+        """
+        if event is None:
+            event = self._env.event()
+        self.put_watchers.append(event)
+        return event
+
+    def cancel_wait(self, event):
+        # the event may have been triggered by a put into another store it is also waiting on
+        if event in self.put_watchers:
+            self.put_watchers.remove(event)
+
+    def _do_put(self, event):
+        if len(self.items) >= self.limit:
+            if self.drop_policy == 'tail':
+                event.succeed()
+                self.drop(event.item, 'tail')
+                return None
+            self.drop(self.pop_oldest(), 'head')
+        n = len(self.items)
+        ret = super()._do_put(event)
+        if len(self.put_watchers) > 0 and len(self.items) > n:
+            watchers, self.put_watchers = self.put_watchers, []
+            for w in watchers:
+                if not w.triggered:
+                    w.succeed()
+        return ret
+
+class WatchedPriorityStore(WatchedStore, simpy.PriorityStore):
+    """PriorityStore that lets processes wait for the next item to be put into it"""
+    def pop_oldest(self):
+        # the heap is not ordered by arrival, so look for the oldest request
+        item = min(self.items, key=lambda msg: msg.start_time)
+        self.items.remove(item)
+        heapq.heapify(self.items)
+        return item
+
+class TrackedStore(WatchedStore):
+    """Store that keeps a shared QueueCounter up to date as items are added and removed,
+    so that the occupancy of a group of queues can be sampled in O(1)
+    """
+    def __init__(self, env, counter, capacity=float('inf')):
+        super().__init__(env, capacity)
+        self.counter = counter
+        # optional object that is told when items are left waiting in this store (i.e. nobody
+        # is blocked on a get) and when the store drains
+        self.listener = None
+
+    def _do_put(self, event):
+        n = len(self.items)
+        ret = super()._do_put(event)
+        self.counter.count += len(self.items) - n
+        if self.listener is not None and len(self.items) > n and len(self.get_queue) == 0:
+            self.listener.queued(self)
+        return ret
+
+    def _do_get(self, event):
+        n = len(self.items)
+        ret = super()._do_get(event)
+        self.counter.count += len(self.items) - n
+        if self.listener is not None and n > 0 and len(self.items) == 0:
+            self.listener.drained(self)
+        return ret
+
+class PreemptiveRequest(Request):
+    """Request which is serviced one quantum at a time and may be preempted in between.
+    Supported quantum policies (quantum_policy):
+      - fixed    : every quantum is preemp ns
+      - adaptive : the quantum doubles each time the request is preempted, up to preemp_max ns
+      - las      : quanta of preemp ns, waiting requests are ordered by least attained service
+                   (see preemptive_queue)
+    """
+    quantum_policies = ['fixed', 'adaptive', 'las']
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.attained = 0
+        self.preemptions = 0
+        self.update_service_time()
+
+    @staticmethod
+    def init_params():
+        PreemptiveRequest.preemp = next(NicSimulator.config['preemp'])
+        PreemptiveRequest.quantum_policy = get_param('quantum_policy', 'fixed')
+        PreemptiveRequest.preemp_max = get_param('preemp_max', float('inf'))
+        PreemptiveRequest.ctx_switch_cost = get_param('ctx_switch_cost', 0)
+        if PreemptiveRequest.quantum_policy not in PreemptiveRequest.quantum_policies:
+            print('ERROR: Unsupported quantum_policy: {}'.format(PreemptiveRequest.quantum_policy))
+            sys.exit(1)
+
+    def quantum(self):
+        if PreemptiveRequest.quantum_policy == 'adaptive':
+            return min(PreemptiveRequest.preemp * 2**self.preemptions, PreemptiveRequest.preemp_max)
+        return PreemptiveRequest.preemp
+
+    def update_service_time(self):
+        # runtime is how long to run the request for at the core before it is preempted
+        # service_time is the remaining service time for the request
+        quantum = self.quantum()
+        if self.service_time > quantum:
+            self.runtime = quantum
+            self.service_time -= quantum
+        else:
+            self.runtime = self.service_time
+            self.service_time = 0
+
+    def advance(self, t):
+        """Account for t ns of service, which must end on a quantum boundary or complete the request"""
+        self.attained += t
+        self.service_time += self.runtime - t
+        self.update_service_time()
+
+    def preempt(self):
+        self.preemptions += 1
+        # the quantum may depend on the number of preemptions
+        self.service_time += self.runtime
+        self.update_service_time()
+
+    def __lt__(self, other):
+        """Least attained service first, used when waiting requests are kept in a priority queue"""
+        return (self.attained, self.ID) < (other.attained, other.ID)
+
+def preemptive_queue(env):
+    """Dispatcher queue for PreemptiveRequests, ordered by attained service under the las quantum policy"""
+    if PreemptiveRequest.quantum_policy == 'las':
+        return WatchedPriorityStore(env)
+    return WatchedStore(env)
+
+class SharedLink:
+    """Capacity-limited resource (e.g. a PCIe link or a memory channel) that transfers are made over.
+    The bandwidth is in bytes/ns (i.e. GB/s). Supported sharing models:
+      - fair : the bandwidth is split equally between the active transfers (processor sharing)
+      - fifo : transfers are served one at a time at the full bandwidth
+    Transfers are simulated as fluid flows, so only arrivals and completions cost events, not bytes.
+    """
+    models = ['fair', 'fifo']
+    # relative tolerance for the rounding errors in attained, and the shortest wake up delay (ns)
+    tolerance = 1e-9
+    min_delay = 1e-3
+
+    def __init__(self, env, name, bandwidth, model='fair', latency=0):
+        if model not in SharedLink.models:
+            print('ERROR: Unsupported sharing model for {}: {}'.format(name, model))
+            sys.exit(1)
+        self.env = env
+        self.name = name
+        self.bandwidth = float(bandwidth)
+        self.model = model
+        self.latency = latency
+        # fair sharing: every active transfer has received `attained` bytes since the link became
+        # busy, so a transfer is done once attained reaches its finish value (kept in a heap).
+        # attained is reset whenever the link goes idle so that it stays small.
+        self.active = []
+        self.attained = 0.0
+        self.last_update = 0
+        self.timer = 0
+        self.seq = 0
+        # fifo sharing: time at which the link finishes the transfers queued so far
+        self.busy_until = 0
+        # stats
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def transfer(self, nbytes):
+        """Event which is triggered once nbytes have been transferred"""
+        self.bytes += nbytes
+        if self.model == 'fifo':
+            start = max(self.env.now, self.busy_until)
+            self.busy_until = start + nbytes/self.bandwidth
+            self.busy_time += nbytes/self.bandwidth
+            return self.env.timeout(self.busy_until + self.latency - self.env.now)
+        self.update()
+        if len(self.active) == 0:
+            self.attained = 0.0
+        done = self.env.event()
+        heapq.heappush(self.active, (self.attained + nbytes, self.seq, done))
+        self.seq += 1
+        self.schedule()
+        if self.latency > 0:
+            # as in fifo mode, the latency is added once the bytes have been transferred
+            delivered = self.env.event()
+            done.callbacks.append(lambda event: self.env.timeout(self.latency).callbacks.append(lambda event: delivered.succeed()))
+            return delivered
+        return done
+
+    def update(self):
+        now = self.env.now
+        if len(self.active) > 0:
+            self.attained += (now - self.last_update)*self.bandwidth/len(self.active)
+            self.busy_time += now - self.last_update
+        self.last_update = now
+
+    def schedule(self):
+        """Wake up when the transfer closest to completion finishes, invalidating any earlier wake up"""
+        self.timer += 1
+        if len(self.active) > 0:
+            timer = self.timer
+            delay = max((self.active[0][0] - self.attained)*len(self.active)/self.bandwidth, SharedLink.min_delay)
+            self.env.timeout(delay).callbacks.append(lambda event: self.expire(timer))
+
+    def expire(self, timer):
+        if timer != self.timer:
+            return
+        self.update()
+        # the wake up was scheduled for the transfer at the head of the heap, so it completes even if
+        # rounding errors left attained slightly short, along with any transfer finishing at the same time
+        finish, seq, done = heapq.heappop(self.active)
+        self.attained = max(self.attained, finish)
+        done.succeed()
+        while len(self.active) > 0 and self.active[0][0] <= self.attained*(1 + SharedLink.tolerance):
+            finish, seq, done = heapq.heappop(self.active)
+            done.succeed()
+        if len(self.active) == 0:
+            self.attained = 0.0
+        self.schedule()
+
+    def utilization(self, end_time):
+        """Fraction of the time up to end_time (e.g. the finish time of the run) the link was busy"""
+        busy = self.busy_time
+        if self.model == 'fifo':
+            # busy_time already counts the transfers queued beyond end_time
+            busy -= max(self.busy_until - end_time, 0)
+        elif len(self.active) > 0 and end_time > self.last_update:
+            busy += end_time - self.last_update
+        return busy/end_time if end_time > 0 else 0.0
+
+class Core(metaclass=abc.ABCMeta):
     """Abstract base class which represents a core to service requests"""
-    __metaclass__ = abc.ABCMeta
     count = 0
     def __init__(self, env, logger, dispatcher):
         self.env = env
         self.logger = logger
         self.dispatcher = dispatcher
-        self.queue = simpy.Store(env)
+        self.queue = TrackedStore(env, dispatcher.core_occupancy)
         self.ID = Core.count
         Core.count += 1
         self.env.process(self.start())
@@ -66,15 +396,102 @@ class Core(object):
         """Receive and process messages"""
         pass
 
+    def dropped(self, msg):
+        """Called when a request is dropped from this core's queue (see WatchedStore.bound).
+        Policies which track the requests assigned to each core should override this.
+        """
+        pass
+
+    def fetch(self, msg):
+        """DMA the request's payload over the PCIe link, the first time the request is dispatched"""
+        if not msg.fetched:
+            msg.fetched = True
+            if msg.dma_bytes > 0 and NicSimulator.pcie is not None:
+                yield NicSimulator.pcie.transfer(msg.dma_bytes)
+
+    def execute(self, msg):
+        """Process a request to completion: fetch its payload, then run for its service time while
+        streaming its memory traffic (it completes when both the compute and the memory traffic are done).
+        This is a generator of events for the core's process to yield from.
+        """
+        yield from self.fetch(msg)
+        compute = self.env.timeout(msg.service_time)
+        if msg.mem_bytes > 0 and NicSimulator.mem is not None:
+            yield self.env.all_of([compute, NicSimulator.mem.transfer(msg.mem_bytes)])
+        else:
+            yield compute
+
+    def serve_preemptive(self, msg, preempt, watched):
+        """Service a PreemptiveRequest until it completes or preempt() is true at the end of a quantum.
+        The request is always serviced for at least one quantum. After that, preempt() can only become
+        true when a request is put into one of the watched queues, so rather than waking up at every
+        quantum boundary this sleeps until the request completes or something arrives, and only then
+        runs on to the next quantum boundary to check preempt(). Without watched queues (e.g. a policy
+        that always preempts) the request is simply serviced one quantum at a time.
+        This is a generator of events for the core's process to yield, i.e.
+            yield from self.serve_preemptive(msg, preempt, watched)
+        msg.runtime > 0 afterwards if the request was preempted.
+        """
+        if NicSimulator.pcie is not None:
+            yield from self.fetch(msg)
+        yield self.env.timeout(msg.runtime)
+        msg.advance(msg.runtime)
+        if len(watched) == 0:
+            while msg.runtime > 0 and not preempt():
+                yield self.env.timeout(msg.runtime)
+                msg.advance(msg.runtime)
+        elif msg.runtime > 0 and not preempt():
+            # a single timeout for the completion of the request, reused until it completes or is
+            # preempted, and a wake up event per sleep that either it or a put into a watched queue triggers
+            wake = [None]
+            def finished(event):
+                if not wake[0].triggered:
+                    wake[0].succeed()
+            self.env.timeout(msg.runtime + msg.service_time).callbacks.append(finished)
+            while True:
+                start = self.env.now
+                quantum = msg.runtime
+                remaining = msg.runtime + msg.service_time
+                wake[0] = self.env.event()
+                for q in watched:
+                    q.wait_put(wake[0])
+                yield wake[0]
+                for q in watched:
+                    q.cancel_wait(wake[0])
+                elapsed = self.env.now - start
+                # run until the next quantum boundary (or completion)
+                run = min(max(1, -(-elapsed // quantum))*quantum, remaining)
+                if run > elapsed:
+                    yield self.env.timeout(run - elapsed)
+                msg.advance(run)
+                if msg.runtime == 0 or preempt():
+                    break
+        if msg.runtime > 0:
+            msg.preempt()
+            if PreemptiveRequest.ctx_switch_cost > 0:
+                yield self.env.timeout(PreemptiveRequest.ctx_switch_cost)
+
+    def get_request(self):
+        """Event which yields the next request for this core to process, taking it from
+        another core's queue if work stealing is enabled and this core's queue is empty
+        """
+        if self.dispatcher.stealer is None:
+            return self.queue.get()
+        return self.env.process(self.dispatcher.stealer.get_request(self))
 
-class Dispatcher(object):
+
+class Dispatcher(metaclass=abc.ABCMeta):
     """Abstract base class which represents the request dispatcher that schedules requests to cores"""
-    __metaclass__ = abc.ABCMeta
     def __init__(self, env, logger):
         self.env = env
         self.logger = logger
-        self.queue = simpy.Store(env)
+        self.queue = WatchedStore(env)
         self.cores = []
+        self.rng = NicSimulator.rng('dispatch')
+        # total number of requests waiting in the queues of this dispatcher's cores
+        self.core_occupancy = QueueCounter()
+        # lets idle cores steal from the queues of busy cores (see WorkStealer)
+        self.stealer = None
         self.env.process(self.start())
 
     @staticmethod
@@ -89,30 +506,320 @@ class Dispatcher(object):
     def add_cores(self, cores):
         self.cores += cores
 
-def DistGenerator(dist, **kwargs):
+class CoreLoadIndex:
+    """Incrementally maintained index of the number of outstanding requests at each core.
+    Cores are kept in per-load buckets so that the least loaded (or an idle) core can be
+    found in O(1) regardless of the number of cores.
+    """
+    def __init__(self, cores, rng):
+        self.rng = rng
+        self.load = {c.ID:0 for c in cores}
+        # buckets[l] holds the cores with load l, pos[ID] is a core's index in its bucket
+        self.buckets = [list(cores)]
+        self.pos = {c.ID:i for i, c in enumerate(cores)}
+        # loads change by one at a time so this pointer moves at most one bucket per update
+        self.min_load = 0
+
+    def _remove(self, core, load):
+        bucket = self.buckets[load]
+        i = self.pos[core.ID]
+        last = bucket.pop()
+        if last is not core:
+            bucket[i] = last
+            self.pos[last.ID] = i
+
+    def _insert(self, core, load):
+        if load == len(self.buckets):
+            self.buckets.append([])
+        bucket = self.buckets[load]
+        self.pos[core.ID] = len(bucket)
+        bucket.append(core)
+
+    def increment(self, core):
+        """A request was assigned to the core"""
+        load = self.load[core.ID]
+        self._remove(core, load)
+        self._insert(core, load + 1)
+        self.load[core.ID] = load + 1
+        if load == self.min_load and len(self.buckets[load]) == 0:
+            self.min_load = load + 1
+
+    def decrement(self, core):
+        """A request assigned to the core has completed"""
+        load = self.load[core.ID]
+        self._remove(core, load)
+        self._insert(core, load - 1)
+        self.load[core.ID] = load - 1
+        if load - 1 < self.min_load:
+            self.min_load = load - 1
+
+    def least_loaded(self):
+        """Pick one of the least loaded cores uniformly at random"""
+        return self.rng.choice(self.buckets[self.min_load])
+
+    def idle_cores(self):
+        """List of cores with no outstanding requests (do not modify)"""
+        return self.buckets[0]
+
+class WorkStealer:
+    """Lets idle cores steal requests waiting in the queues of the other cores of the same dispatcher.
+    Cores with waiting requests are kept in an index that is updated as their queues fill and drain,
+    and idle cores are woken up when a request is left waiting, so probing never scans all cores.
+    Supported probe policies:
+      - random : steal from a core picked uniformly at random among the cores with waiting requests
+      - pod    : steal from the longest of steal_d cores picked at random among them
+    Each steal attempt costs steal_cost ns.
+    """
+    policies = ['random', 'pod']
+
+    def __init__(self, env, logger, cores, policy, cost, d):
+        self.env = env
+        self.logger = logger
+        self.policy = policy
+        self.cost = cost
+        self.d = d
+        self.rng = NicSimulator.rng('stealing')
+        # cores with waiting requests, pos[ID] is a core's index in victims
+        self.victims = []
+        self.pos = {}
+        self.owner = {}
+        # idle cores waiting to be told that there is something to steal
+        self.thieves = collections.OrderedDict()
+        for c in cores:
+            c.queue.listener = self
+            self.owner[c.queue] = c
+
+    def queued(self, store):
+        core = self.owner[store]
+        if core.ID not in self.pos:
+            self.pos[core.ID] = len(self.victims)
+            self.victims.append(core)
+        self.wake_thief()
+
+    def drained(self, store):
+        core = self.owner[store]
+        if core.ID in self.pos:
+            i = self.pos.pop(core.ID)
+            last = self.victims.pop()
+            if last is not core:
+                self.victims[i] = last
+                self.pos[last.ID] = i
+
+    def wake_thief(self):
+        if len(self.thieves) > 0:
+            core_id, wake = self.thieves.popitem(last=False)
+            wake.succeed()
+
+    @staticmethod
+    def surplus(core):
+        """Number of requests in the core's queue that the core is not already waiting for"""
+        return len(core.queue.items) - len(core.queue.get_queue)
+
+    def pick_victim(self):
+        if len(self.victims) == 0:
+            return None
+        if self.policy == 'random':
+            return self.rng.choice(self.victims)
+        elif self.policy == 'pod':
+            return max(self.rng.sample(self.victims, min(self.d, len(self.victims))), key=WorkStealer.surplus)
+
+    def get_request(self, core):
+        while True:
+            if len(core.queue.items) > 0:
+                msg = yield core.queue.get()
+                return msg
+            victim = self.pick_victim()
+            if victim is not None:
+                if self.cost > 0:
+                    yield self.env.timeout(self.cost)
+                # the victim may have drained its queue while the steal was in progress
+                if WorkStealer.surplus(victim) > 0:
+                    msg = yield victim.queue.get()
+                    self.logger.log('Core {} stole msg from core {}:\n\t"{}"'.format(core.ID, victim.ID, str(msg)))
+                    return msg
+                continue
+            # nothing to steal, wait for a request to arrive locally or to be left waiting elsewhere
+            get = core.queue.get()
+            wake = self.env.event()
+            self.thieves[core.ID] = wake
+            yield get | wake
+            if get.triggered:
+                if wake.triggered:
+                    # pass the wake up on to another idle core
+                    self.wake_thief()
+                else:
+                    del self.thieves[core.ID]
+                return get.value
+            get.cancel()
+
+class LoadBalancer:
+    """Top-level load balancer which spreads requests across multiple NIC queues (dispatchers).
+    Supported policies:
+      - random      : pick a NIC queue uniformly at random (i.e. RSS hashing of independent flows)
+      - round_robin : cycle through the NIC queues
+      - jsq         : pick the NIC queue with the fewest waiting requests
+    """
+    policies = ['random', 'round_robin', 'jsq']
+
+    def __init__(self, env, logger, dispatchers, policy):
+        self.env = env
+        self.logger = logger
+        self.dispatchers = dispatchers
+        self.queue = simpy.Store(env)
+        self.policy = policy
+        self.rng = NicSimulator.rng('balancer')
+        if self.policy not in LoadBalancer.policies:
+            print('ERROR: Unsupported lb_policy: {}'.format(self.policy))
+            sys.exit(1)
+        self.next_idx = 0
+        self.env.process(self.start())
+
+    @staticmethod
+    def waiting(dispatcher):
+        return len(dispatcher.queue.items) + dispatcher.core_occupancy.count
+
+    def pick_dispatcher(self):
+        if self.policy == 'random':
+            return self.rng.choice(self.dispatchers)
+        elif self.policy == 'round_robin':
+            d = self.dispatchers[self.next_idx]
+            self.next_idx = (self.next_idx + 1) % len(self.dispatchers)
+            return d
+        elif self.policy == 'jsq':
+            return min(self.dispatchers, key=LoadBalancer.waiting)
+
+    def start(self):
+        while not NicSimulator.complete:
+            msg = yield self.queue.get()
+            self.logger.log('Balancing msg\n\t"{}"'.format(str(msg)))
+            self.pick_dispatcher().queue.put(msg)
+
+def DistGenerator(dist, rng, block_size=4096, **kwargs):
+    """Generate samples from the given distribution using the rng stream, drawing them in blocks"""
+    gen = rng.generator
+    if dist == 'fixed':
+        while True:
+            yield kwargs['value']
     if dist == 'bimodal':
-        bimodal_samples = map(int, list(np.random.normal(kwargs['lower_mean'], kwargs['lower_stddev'], kwargs['lower_samples']))
-                                   + list(np.random.normal(kwargs['upper_mean'], kwargs['upper_stddev'], kwargs['upper_samples'])))
+        bimodal_samples = np.concatenate([gen.normal(kwargs['lower_mean'], kwargs['lower_stddev'], kwargs['lower_samples']),
+                                          gen.normal(kwargs['upper_mean'], kwargs['upper_stddev'], kwargs['upper_samples'])]).astype(np.int64)
     while True:
         if dist == 'uniform':
-            yield random.randint(kwargs['min'], kwargs['max'])
+            block = gen.integers(kwargs['min'], kwargs['max'], block_size, endpoint=True)
         elif dist == 'normal':
-            yield int(np.random.normal(kwargs['mean'], kwargs['stddev']))
+            block = gen.normal(kwargs['mean'], kwargs['stddev'], block_size).astype(np.int64)
         elif dist == 'poisson':
-            yield np.random.poisson(kwargs['lambda']) 
+            block = gen.poisson(kwargs['lambda'], block_size)
         elif dist == 'lognormal':
-            yield int(np.random.lognormal(kwargs['mean'], kwargs['sigma']))
+            block = gen.lognormal(kwargs['mean'], kwargs['sigma'], block_size).astype(np.int64)
         elif dist == 'exponential':
-            yield int(np.random.exponential(kwargs['lambda']))
-        elif dist == 'fixed':
-            yield kwargs['value']
+            block = gen.exponential(kwargs['lambda'], block_size).astype(np.int64)
         elif dist == 'bimodal':
-            yield random.choice(bimodal_samples)
+            block = gen.choice(bimodal_samples, block_size)
         else:
-            print 'ERROR: Unsupported distrbution: {}'.format(dist)
+            print('ERROR: Unsupported distrbution: {}'.format(dist))
             sys.exit(1)
+        yield from block.tolist()
+
+def ArrivalProcess(spec, rng, phase_rng, block_size=4096):
+    """Generate (arrival delay, phase) pairs for a Poisson arrival process whose rate changes over time.
+    The delay is the time since the previous arrival and the phase is the name of the state the process
+    was in when the request arrived. Inter-arrival times are unit exponentials drawn from the rng stream
+    in blocks and scaled by the mean delay of the current state, so draws left over at the end of a
+    state are used by the next one. State durations and transitions come from the phase_rng stream.
+    Supported types (spec['type']):
+      - mmpp      : Markov-modulated Poisson process, state i lasts Exp(mean_sojourns[i]) ns with
+                    mean_delays[i] ns between arrivals and is followed by a state drawn from row i of the
+                    transitions matrix (by default uniformly one of the other states)
+      - onoff     : two state mmpp, an on state with mean_delay ns between arrivals lasting Exp(mean_on) ns
+                    and an off state lasting Exp(mean_off) ns without arrivals (or off_mean_delay ns apart)
+      - piecewise : piecewise constant rate, segment i lasts durations[i] ns with mean_delays[i] ns between
+                    arrivals and the segments repeat (e.g. a diurnal pattern)
+    mmpp and piecewise states may be named with names.
+    """
+    gen = rng.generator
+    kind = spec['type']
+    if kind == 'onoff':
+        delays = [spec['mean_delay'], spec.get('off_mean_delay', float('inf'))]
+        durations = [spec['mean_on'], spec['mean_off']]
+        names = ['on', 'off']
+    elif kind == 'mmpp' or kind == 'piecewise':
+        delays = spec['mean_delays']
+        durations = spec['mean_sojourns'] if kind == 'mmpp' else spec['durations']
+        names = spec.get('names', [str(i) for i in range(len(delays))])
+    else:
+        print('ERROR: Unsupported arrival process: {}'.format(kind))
+        sys.exit(1)
+    n = len(delays)
+    if kind != 'piecewise':
+        if 'transitions' in spec:
+            transitions = np.array(spec['transitions'], dtype=float)
+        else:
+            transitions = (np.ones((n, n)) - np.eye(n))/max(n - 1, 1) if n > 1 else np.ones((1, 1))
+    state = 0
+    now = 0.0
+    last = 0
+    unit = np.empty(0)
+    pos = 0
+    while True:
+        end = now + (durations[state] if kind == 'piecewise' else phase_rng.generator.exponential(durations[state]))
+        if delays[state] != float('inf'):
+            # only look at about as many draws as the state is expected to need
+            window = int(2*(end - now)/delays[state]) + 16
+            while True:
+                if pos == len(unit):
+                    unit = gen.exponential(1.0, block_size)
+                    pos = 0
+                m = min(len(unit) - pos, window)
+                times = now + np.cumsum(unit[pos:pos + m])*delays[state]
+                k = np.searchsorted(times, end)
+                for t in times[:k].astype(np.int64).tolist():
+                    yield t - last, names[state]
+                    last = t
+                if k < m:
+                    # the gap crossing the end of the state is used up
+                    pos += k + 1
+                    break
+                pos += m
+                now = times[-1]
+        # arrivals are memoryless, so the partial gap at the end of the state is simply discarded
+        now = end
+        if kind == 'piecewise':
+            state = (state + 1) % n
+        else:
+            state = phase_rng.generator.choice(n, p=transitions[state])
+
+def config_dist(prefix, rng):
+    """DistGenerator for the distribution named by the prefix parameter (e.g. service_time),
+    configured by the prefix_* parameters
+    """
+    dist = next(NicSimulator.config[prefix])
+    kwargs = {}
+    if dist == 'uniform':
+        kwargs['min'] = next(NicSimulator.config[prefix + '_min'])
+        kwargs['max'] = next(NicSimulator.config[prefix + '_max'])
+    elif dist == 'normal':
+        kwargs['mean'] = next(NicSimulator.config[prefix + '_mean'])
+        kwargs['stddev'] = next(NicSimulator.config[prefix + '_stddev'])
+    elif dist == 'poisson':
+        kwargs['lambda'] = next(NicSimulator.config[prefix + '_lambda'])
+    elif dist == 'lognormal':
+        kwargs['mean'] = next(NicSimulator.config[prefix + '_mean'])
+        kwargs['sigma'] = next(NicSimulator.config[prefix + '_sigma'])
+    elif dist == 'exponential':
+        kwargs['lambda'] = next(NicSimulator.config[prefix + '_lambda'])
+    elif dist == 'fixed':
+        kwargs['value'] = next(NicSimulator.config[prefix + '_value'])
+    elif dist == 'bimodal':
+        kwargs['lower_mean'] = next(NicSimulator.config[prefix + '_lower_mean'])
+        kwargs['lower_stddev'] = next(NicSimulator.config[prefix + '_lower_stddev'])
+        kwargs['lower_samples'] = next(NicSimulator.config[prefix + '_lower_samples'])
+        kwargs['upper_mean'] = next(NicSimulator.config[prefix + '_upper_mean'])
+        kwargs['upper_stddev'] = next(NicSimulator.config[prefix + '_upper_stddev'])
+        kwargs['upper_samples'] = next(NicSimulator.config[prefix + '_upper_samples'])
+    return NicSimulator.profiled(prefix, DistGenerator(dist, rng, **kwargs))
 
-class LoadGenerator(object):
+class LoadGenerator:
     """This class generates a load for the dispatcher
     """
     def __init__(self, env, logger, queue, request_cls):
@@ -122,76 +829,510 @@ class LoadGenerator(object):
         self.queue = queue
         self.request_cls = request_cls
 
-        self.service_time = NicSimulator.config['service_time'].next()
-        # initialize service time distribution params
-        kwargs = {}
-        if self.service_time == 'uniform':
-            kwargs['min'] = NicSimulator.config['service_time_min'].next()
-            kwargs['max'] = NicSimulator.config['service_time_max'].next()
-        elif self.service_time == 'normal':
-            kwargs['mean'] = NicSimulator.config['service_time_mean'].next()
-            kwargs['stddev'] = NicSimulator.config['service_time_stddev'].next()
-        elif self.service_time == 'poisson':
-            kwargs['lambda'] = NicSimulator.config['service_time_lambda'].next()
-        elif self.service_time == 'lognormal':
-            kwargs['mean'] = NicSimulator.config['service_time_mean'].next()
-            kwargs['sigma'] = NicSimulator.config['service_time_sigma'].next()
-        elif self.service_time == 'exponential':
-            kwargs['lambda'] = NicSimulator.config['service_time_lambda'].next()
-        elif self.service_time == 'fixed':
-            kwargs['value'] = NicSimulator.config['service_time_value'].next()
-        elif self.service_time == 'bimodal':
-            kwargs['lower_mean'] = NicSimulator.config['service_time_lower_mean'].next()
-            kwargs['lower_stddev'] = NicSimulator.config['service_time_lower_stddev'].next()
-            kwargs['lower_samples'] = NicSimulator.config['service_time_lower_samples'].next()
-            kwargs['upper_mean'] = NicSimulator.config['service_time_upper_mean'].next()
-            kwargs['upper_stddev'] = NicSimulator.config['service_time_upper_stddev'].next()
-            kwargs['upper_samples'] = NicSimulator.config['service_time_upper_samples'].next()
-        self.service_time_dist = DistGenerator(self.service_time, **kwargs)
-
-        self.arrival_delay = NicSimulator.config['arrival_delay'].next()
+        self.service_time_dist = config_dist('service_time', NicSimulator.rng('service'))
+        # optionally hold back new requests while max_outstanding requests are in flight
+        self.max_outstanding = get_param('max_outstanding', 0)
+        self.sent = 0
+        self.space = None
+        if self.max_outstanding > 0:
+            NicSimulator.on_completion(self.completed)
+            NicSimulator.on_drop(self.completed)
+
+        # bursty / time-varying arrivals are described by a dict, see ArrivalProcess
+        self.arrival_process = get_param('arrival_process', None)
+        if self.arrival_process is not None:
+            self.arrivals = NicSimulator.profiled('arrival_process', ArrivalProcess(self.arrival_process, NicSimulator.rng('arrivals'), NicSimulator.rng('phases')))
+        else:
+            self.arrival_delay_dist = self.init_arrival_delay_dist()
+
+    def init_arrival_delay_dist(self):
+        self.arrival_delay = next(NicSimulator.config['arrival_delay'])
         # initialize arrival delay distribution params
         kwargs = {}
         if self.arrival_delay == 'uniform':
-            kwargs['min'] = NicSimulator.config['arrival_delay_min'].next()
-            kwargs['max'] = NicSimulator.config['arrival_delay_max'].next()
+            kwargs['min'] = next(NicSimulator.config['arrival_delay_min'])
+            kwargs['max'] = next(NicSimulator.config['arrival_delay_max'])
         elif self.arrival_delay == 'normal':
-            kwargs['mean'] = NicSimulator.config['arrival_delay_mean'].next()
-            kwargs['stddev'] = NicSimulator.config['arrival_delay_stddev'].next()
+            kwargs['mean'] = next(NicSimulator.config['arrival_delay_mean'])
+            kwargs['stddev'] = next(NicSimulator.config['arrival_delay_stddev'])
         elif self.arrival_delay == 'poisson':
-            kwargs['lambda'] = NicSimulator.config['arrival_delay_lambda'].next()
+            kwargs['lambda'] = next(NicSimulator.config['arrival_delay_lambda'])
         elif self.arrival_delay == 'lognormal':
-            kwargs['mean'] = NicSimulator.config['arrival_delay_mean'].next()
-            kwargs['sigma'] = NicSimulator.config['arrival_delay_sigma'].next()
+            kwargs['mean'] = next(NicSimulator.config['arrival_delay_mean'])
+            kwargs['sigma'] = next(NicSimulator.config['arrival_delay_sigma'])
         elif self.arrival_delay == 'exponential':
-            kwargs['scale'] = NicSimulator.config['arrival_delay_scale'].next()
+            kwargs['lambda'] = next(NicSimulator.config['arrival_delay_scale'])
         elif self.arrival_delay == 'fixed':
-            kwargs['value'] = NicSimulator.config['arrival_delay_value'].next()
+            kwargs['value'] = next(NicSimulator.config['arrival_delay_value'])
         elif self.arrival_delay == 'bimodal':
-            kwargs['lower_mean'] = NicSimulator.config['arrival_delay_lower_mean'].next()
-            kwargs['lower_stddev'] = NicSimulator.config['arrival_delay_lower_stddev'].next()
-            kwargs['lower_samples'] = NicSimulator.config['arrival_delay_lower_samples'].next()
-            kwargs['upper_mean'] = NicSimulator.config['arrival_delay_upper_mean'].next()
-            kwargs['upper_stddev'] = NicSimulator.config['arrival_delay_upper_stddev'].next()
-            kwargs['upper_samples'] = NicSimulator.config['arrival_delay_upper_samples'].next()
-        self.arrival_delay_dist = DistGenerator(self.arrival_delay, **kwargs)
+            kwargs['lower_mean'] = next(NicSimulator.config['arrival_delay_lower_mean'])
+            kwargs['lower_stddev'] = next(NicSimulator.config['arrival_delay_lower_stddev'])
+            kwargs['lower_samples'] = next(NicSimulator.config['arrival_delay_lower_samples'])
+            kwargs['upper_mean'] = next(NicSimulator.config['arrival_delay_upper_mean'])
+            kwargs['upper_stddev'] = next(NicSimulator.config['arrival_delay_upper_stddev'])
+            kwargs['upper_samples'] = next(NicSimulator.config['arrival_delay_upper_samples'])
+        return NicSimulator.profiled('arrival_delay', DistGenerator(self.arrival_delay, NicSimulator.rng('arrivals'), **kwargs))
+
+    def completed(self, msg, now):
+        if self.space is not None:
+            space, self.space = self.space, None
+            space.succeed()
+
+    def wait_for_space(self):
+        """Block while max_outstanding requests are in flight"""
+        while self.max_outstanding > 0 and self.sent - NicSimulator.request_cnt - NicSimulator.drop_cnt >= self.max_outstanding:
+            self.space = self.env.event()
+            yield self.space
+        self.sent += 1
 
     def start(self):
         """Start generating requests"""
+        if self.arrival_process is not None:
+            yield from self.start_process()
+            return
         for i in range(NicSimulator.num_requests):
+            yield from self.wait_for_space()
             self.logger.log('Generating request')
             # generate and record service time
-            service_time = self.service_time_dist.next()
+            service_time = next(self.service_time_dist)
             NicSimulator.service_times['all'].append(service_time)
             # generate and record arrival delay
-            arrival_delay = self.arrival_delay_dist.next()
+            arrival_delay = next(self.arrival_delay_dist)
             NicSimulator.arrival_delays['all'].append(arrival_delay)
             # put the request in the core's queue
-            self.queue.put(self.request_cls(service_time, self.env.now))
+            msg = NicSimulator.add_demands(self.request_cls(service_time, self.env.now))
+            if NicSimulator.admit(msg, service_time):
+                self.queue.put(msg)
+            yield self.env.timeout(arrival_delay)
+
+    def start_process(self):
+        """Generate requests at the arrival times of the arrival process"""
+        for i in range(NicSimulator.num_requests):
+            arrival_delay, phase = next(self.arrivals)
+            NicSimulator.arrival_delays['all'].append(arrival_delay)
             yield self.env.timeout(arrival_delay)
+            yield from self.wait_for_space()
+            self.logger.log('Generating request')
+            service_time = next(self.service_time_dist)
+            NicSimulator.service_times['all'].append(service_time)
+            msg = NicSimulator.add_demands(self.request_cls(service_time, self.env.now))
+            msg.phase = phase
+            if NicSimulator.admit(msg, service_time):
+                self.queue.put(msg)
+
+
+class ClosedLoopClients:
+    """Closed-loop load: num_clients clients that each keep up to client_outstanding requests in flight.
+    After a request completes, its client thinks for a time drawn from the think_time distribution
+    (think_time_* parameters, default 0) before sending the next one, so the load adapts to the
+    throughput of the system and the number of requests in the system stays bounded.
+    """
+    def __init__(self, env, logger, queue, request_cls):
+        self.env = env
+        self.logger = logger
+        # this queue will be drained by the dispatcher
+        self.queue = queue
+        self.request_cls = request_cls
+        self.num_clients = next(NicSimulator.config['num_clients'])
+        self.outstanding = get_param('client_outstanding', 1)
+        self.service_time_dist = config_dist('service_time', NicSimulator.rng('service'))
+        if 'think_time' in NicSimulator.config:
+            self.think_time_dist = config_dist('think_time', NicSimulator.rng('think_time'))
+        else:
+            self.think_time_dist = None
+        self.sent = 0
+        self.arrival_process = None
+        NicSimulator.on_completion(self.completed)
+        NicSimulator.on_drop(self.completed)
+
+    def completed(self, msg, now):
+        if msg.reply is not None:
+            msg.reply.succeed()
+
+    def start(self):
+        """Start all clients"""
+        yield self.env.all_of([self.env.process(self.client(client))
+                               for client in range(self.num_clients) for i in range(self.outstanding)])
+
+    def client(self, client):
+        """One outstanding request slot of a client"""
+        while self.sent < NicSimulator.num_requests:
+            if self.think_time_dist is not None:
+                think_time = next(self.think_time_dist)
+                yield self.env.timeout(think_time)
+                if self.sent == NicSimulator.num_requests:
+                    break
+                # record think times as the arrival delays of the closed-loop load, only for the
+                # requests actually sent
+                NicSimulator.arrival_delays['all'].append(think_time)
+            self.logger.log('Client {} generating request'.format(client))
+            service_time = next(self.service_time_dist)
+            NicSimulator.service_times['all'].append(service_time)
+            msg = NicSimulator.add_demands(self.request_cls(service_time, self.env.now))
+            msg.client = client
+            msg.reply = self.env.event()
+            self.sent += 1
+            if NicSimulator.admit(msg, service_time):
+                self.queue.put(msg)
+            yield msg.reply
+
+class LatencyHistogram:
+    """Histogram with logarithmically sized buckets, used to estimate latency percentiles
+    on the fly (with a relative error of at most precision) without sorting all samples
+    """
+    def __init__(self, precision=0.01):
+        self.log_base = np.log1p(precision)
+        self.counts = np.zeros(1, dtype=np.int64)
+        self.total = 0
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        idx = (np.log(np.maximum(np.asarray(values, dtype=float), 1.0))/self.log_base).astype(np.int64)
+        counts = np.bincount(idx)
+        if len(counts) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counts)] += counts
+        self.total += len(values)
+
+    def percentile(self, p):
+        if self.total == 0:
+            return float('nan')
+        i = np.searchsorted(np.cumsum(self.counts), p/100.0*self.total)
+        return float(np.exp((i + 0.5)*self.log_base))
+
+class Recorder:
+    """Append-only column of samples for the run logs (e.g. completion times).
+    Samples are collected in a short list and packed into typed chunks of chunk_size samples, which
+    are kept in memory or, given a spill_file, written to disk so that the memory a recorder uses
+    stays bounded however long the run is. Spilled recorders estimate percentiles with a
+    LatencyHistogram (within 1%) rather than loading all samples back.
+    """
+    def __init__(self, chunk_size=65536, spill_file=None, dtype=None):
+        self.chunk_size = chunk_size
+        self.spill_file = spill_file
+        # inferred from the first chunk unless given, and widened (e.g. from ints to floats) when
+        # later samples do not fit it
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.pending = []
+        self.chunks = []
+        self.stored = 0
+        self.spill = None
+
+    def append(self, x):
+        self.pending.append(x)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        chunk = self.pack(self.pending)
+        self.pending = []
+        self.stored += len(chunk)
+        if self.spill_file is None:
+            self.chunks.append(chunk)
+            return
+        if self.spill is None:
+            self.spill = open(self.spill_file, 'wb')
+        chunk.tofile(self.spill)
+
+    def pack(self, samples):
+        """Typed array of the samples, widening the dtype of the recorder if they do not fit it"""
+        chunk = np.asarray(samples)
+        if self.dtype is None:
+            self.dtype = chunk.dtype
+        elif chunk.dtype != self.dtype:
+            if not (np.issubdtype(self.dtype, np.number) and np.issubdtype(chunk.dtype, np.number)):
+                raise ValueError('Recorder of {} samples can not hold {} samples'.format(self.dtype, chunk.dtype))
+            dtype = np.result_type(self.dtype, chunk.dtype)
+            if dtype != self.dtype:
+                self.widen(dtype)
+        return chunk.astype(self.dtype, copy=False)
+
+    def widen(self, dtype):
+        """Convert the samples stored so far to dtype"""
+        if self.spill is not None:
+            self.spill.close()
+            with open(self.spill_file, 'rb') as src, open(self.spill_file + '.tmp', 'wb') as dst:
+                while True:
+                    block = np.fromfile(src, dtype=self.dtype, count=self.chunk_size)
+                    if len(block) == 0:
+                        break
+                    block.astype(dtype).tofile(dst)
+            os.replace(self.spill_file + '.tmp', self.spill_file)
+            self.spill = open(self.spill_file, 'ab')
+        self.chunks = [chunk.astype(dtype) for chunk in self.chunks]
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.stored + len(self.pending)
+
+    def blocks(self, start=0):
+        """Iterate over the samples from index start on, in arrays of at most chunk_size samples.
+        Recorders of the same length and chunk_size yield aligned blocks.
+        """
+        if self.spill is not None:
+            self.spill.flush()
+            with open(self.spill_file, 'rb') as f:
+                f.seek(min(start, self.stored)*self.dtype.itemsize)
+                while True:
+                    block = np.fromfile(f, dtype=self.dtype, count=self.chunk_size)
+                    if len(block) == 0:
+                        break
+                    yield block
+        else:
+            offset = 0
+            for chunk in self.chunks:
+                if start < offset + len(chunk):
+                    yield chunk[max(start - offset, 0):]
+                offset += len(chunk)
+        start = max(start - self.stored, 0)
+        if start < len(self.pending):
+            yield self.pack(self.pending[start:])
+
+    def values(self, start=0):
+        """All samples from index start on as one array (only use on recorders kept in memory)"""
+        blocks = list(self.blocks(start))
+        return np.concatenate(blocks) if len(blocks) > 0 else np.array([], dtype=self.dtype)
+
+    def mean(self):
+        return sum(float(block.sum()) for block in self.blocks())/len(self) if len(self) > 0 else float('nan')
+
+    def percentile(self, p):
+        if self.spill is None:
+            return np.percentile(self.values(), p)
+        hist = LatencyHistogram()
+        for block in self.blocks():
+            hist.add(block)
+        return hist.percentile(p)
 
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
 
-class NicSimulator(object):
+class ProgressMonitor:
+    """Periodically reports the progress of a run (to stderr and optionally to a JSON file
+    that a dashboard can poll). The monitor wakes up in simulated time, adapting its step so
+    that it only checks the wall clock a few times per reporting interval.
+    """
+    def __init__(self, env, interval, filename=None):
+        self.env = env
+        self.interval = interval
+        self.filename = filename
+        self.hist = LatencyHistogram()
+        self.seen = 0
+        self.start_wall = time.time()
+        self.last_wall = self.start_wall
+        self.last_events = 0
+
+    def events(self):
+        # events scheduled so far, read off SimPy's event id counter (count(n)) without drawing an id
+        return int(repr(self.env._eid)[len('count('):-1])
+
+    def start(self):
+        step = 1000
+        last_check = time.time()
+        while not NicSimulator.complete:
+            yield self.env.timeout(step)
+            now = time.time()
+            if now - self.last_wall >= self.interval:
+                self.report(now)
+            # aim for 5-20 wall clock checks per reporting interval
+            if now - last_check < self.interval/20.0:
+                step *= 2
+            elif now - last_check > self.interval/5.0 and step > 1:
+                step //= 2
+            last_check = now
+        self.report(time.time())
+
+    def report(self, now):
+        completion_times = NicSimulator.completion_times['all']
+        for block in completion_times.blocks(self.seen):
+            self.hist.add(block)
+        self.seen = len(completion_times)
+        events = self.events()
+        completed = NicSimulator.request_cnt
+        dropped = NicSimulator.drop_cnt
+        arrived = len(NicSimulator.service_times['all'])
+        elapsed = now - self.start_wall
+        done = float(completed + dropped)/NicSimulator.num_requests
+        stats = collections.OrderedDict([
+            ('run', NicSimulator.out_run_dir),
+            ('done', round(100*done, 1)),
+            ('completed', completed),
+            ('arrived', arrived),
+            ('dropped', dropped),
+            ('backlog', arrived - completed - dropped),
+            ('sim_time_us', self.env.now*1e-3),
+            ('events', events),
+            ('events_per_sec', int((events - self.last_events)/max(now - self.last_wall, 1e-9))),
+            ('wall_sec', round(elapsed, 1)),
+            ('eta_sec', round(elapsed*(1 - done)/done, 1) if done > 0 else None),
+            ('p99_us', round(self.hist.percentile(99)*1e-3, 3)),
+        ])
+        self.last_wall = now
+        self.last_events = events
+        sys.stderr.write(' '.join('{}={}'.format(k, v) for k, v in stats.items()) + '\n')
+        if self.filename is not None:
+            # write then rename so that readers never see a partial file
+            with open(self.filename + '.tmp', 'w') as f:
+                json.dump(stats, f)
+            os.replace(self.filename + '.tmp', self.filename)
+
+class Profiler:
+    """Attributes the wall time of a run to the simulator components (see --profile).
+    Every SimPy process, distribution generator and recorder is wrapped so that the time spent running
+    it is charged to it, exclusive of the components it calls into (e.g. a core recording a completion),
+    and whatever time is not spent in a component is charged to the SimPy scheduler. Components are
+    identified by (component, instance, activity), e.g. ('JBSQCore', 3, 'start').
+    """
+    scheduler = ('simpy', '', 'scheduler')
+
+    def __init__(self):
+        # times and counts are kept per stack of components, which gives the flamegraph
+        self.times = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+        self.stack = [(Profiler.scheduler,)]
+        self.instances = {}
+        self.numbered = collections.defaultdict(int)
+        self.start()
+
+    def start(self):
+        """Start the clock, when the simulation starts running"""
+        self.start_wall = time.perf_counter()
+        self.last = self.start_wall
+        self.wall = 0
+
+    def key(self, generator):
+        """Key of the component that owns the process generator"""
+        frame = generator.gi_frame
+        obj = frame.f_locals.get('self') if frame is not None else None
+        if obj is None:
+            return ('process', '', generator.__name__)
+        component = type(obj).__name__
+        instance = getattr(obj, 'ID', None)
+        if instance is None:
+            # number the instances of components without an ID in order of appearance
+            if id(obj) not in self.instances:
+                self.instances[id(obj)] = self.numbered[component]
+                self.numbered[component] += 1
+            instance = self.instances[id(obj)]
+        return (component, instance, generator.__name__)
+
+    def enter(self, key):
+        now = time.perf_counter()
+        path = self.stack[-1]
+        self.times[path] += now - self.last
+        path = path + (key,)
+        self.counts[path] += 1
+        self.stack.append(path)
+        self.last = now
+
+    def leave(self):
+        now = time.perf_counter()
+        self.times[self.stack.pop()] += now - self.last
+        self.last = now
+
+    def process(self, key, generator):
+        """Process generator which runs generator, charging the time spent in it to key"""
+        value = None
+        exc = None
+        while True:
+            self.enter(key)
+            try:
+                event = generator.send(value) if exc is None else generator.throw(exc)
+            except StopIteration as e:
+                self.leave()
+                return e.value
+            except BaseException:
+                self.leave()
+                raise
+            self.leave()
+            try:
+                value = yield event
+                exc = None
+            except BaseException as e:
+                value = None
+                exc = e
+
+    def iterate(self, key, iterator):
+        """Generator which yields the items of iterator, charging the time spent producing them to key"""
+        while True:
+            self.enter(key)
+            try:
+                x = next(iterator)
+            except StopIteration:
+                self.leave()
+                return
+            self.leave()
+            yield x
+
+    def call(self, key, function):
+        """Function which calls function, charging the time spent in it to key"""
+        def profiled(*args):
+            self.enter(key)
+            try:
+                return function(*args)
+            finally:
+                self.leave()
+        return profiled
+
+    def stop(self):
+        now = time.perf_counter()
+        self.times[self.stack[-1]] += now - self.last
+        self.last = now
+        self.wall = now - self.start_wall
+
+    def breakdown(self, steps):
+        """DataFrame with the exclusive wall time and number of activations of every component"""
+        times = collections.defaultdict(float)
+        counts = collections.defaultdict(int)
+        for path, t in self.times.items():
+            times[path[-1]] += t
+        for path, n in self.counts.items():
+            counts[path[-1]] += n
+        counts[Profiler.scheduler] = steps
+        keys = sorted(times, key=lambda k: -times[k])
+        return pd.DataFrame({'component': [k[0] for k in keys],
+                             'instance': [k[1] for k in keys],
+                             'activity': [k[2] for k in keys],
+                             'wall_sec': [times[k] for k in keys],
+                             'pct': [100*times[k]/self.wall if self.wall > 0 else 0 for k in keys],
+                             'events': [counts[k] for k in keys]})
+
+    def dump(self, out_dir, steps):
+        """Write profile.csv and profile.folded (flamegraph.pl / speedscope input) to out_dir
+        and print a per component summary
+        """
+        df = self.breakdown(steps)
+        write_csv(df, os.path.join(out_dir, 'profile.csv'))
+        # collapse the instances of a component in the flamegraph
+        folded = collections.defaultdict(float)
+        for path, t in self.times.items():
+            folded[';'.join('{}.{}'.format(k[0], k[2]) for k in path)] += t
+        with open(os.path.join(out_dir, 'profile.folded'), 'w') as f:
+            for stack, t in sorted(folded.items()):
+                f.write('{} {}\n'.format(stack, int(t*1e6))) # microseconds
+        summary = df.groupby(['component', 'activity'])[['wall_sec', 'pct', 'events']].sum().sort_values('wall_sec', ascending=False)
+        print('Profile of {} ({:.2f} sec, {} events):'.format(out_dir, self.wall, steps))
+        print(summary.to_string(float_format=lambda x: '{:.3f}'.format(x)))
+
+class ProfiledEnvironment(simpy.Environment):
+    """Environment which charges the time spent in every process to its component (see Profiler)"""
+    def __init__(self, profiler):
+        super().__init__()
+        self.profiler = profiler
+        self.steps = 0
+
+    def process(self, generator):
+        return super().process(self.profiler.process(self.profiler.key(generator), generator))
+
+    def step(self):
+        self.steps += 1
+        super().step()
+
+class NicSimulator:
     """This class controls the simulation"""
     config = {} # user specified input
     out_dir = 'out'
@@ -200,63 +1341,295 @@ class NicSimulator(object):
     complete = False
     finish_time = 0
     request_cnt = 0
-    service_times = {'all':[]}
-    arrival_delays = {'all':[]}
+    service_times = {}
+    arrival_delays = {}
     completion_times = {'all':[]}
+    # completion times per arrival process phase
+    phase_completion_times = {}
+    # recorders of this run (see NicSimulator.recorder)
+    recorders = []
+    chunk_size = 65536
+    spill_dir = None
+    # functions called with (request, time) whenever a request completes or is dropped
+    completion_callbacks = []
+    drop_callbacks = []
+    # requests dropped by bounded queues or deadline admission in this run, by reason
+    drop_cnt = 0
+    drops = {}
+    slo = 0 # ns
+    slo_cnt = 0
+    service_time_sum = 0
+    # shared resources and the distributions of the demands on them
+    pcie = None
+    mem = None
+    dma_bytes_dist = None
+    mem_bytes_dist = None
     # global logs (across runs)
-    tail_completion_times = {'99pc':[], '90pc':[]}
+    tail_completion_times = {'90pc':[], '99pc':[]}
     avg_throughput = {'all':[]}
+    drop_stats = {'dropped':[], 'drop_rate':[], 'goodput':[]}
+    progress = 0 # seconds between progress reports
+    progress_file = None
+    # profiles the current run if set (see --profile)
+    profiler = None
+    # parameter values used by the current run and its summary metrics (see ResultsCatalog)
+    run_params = {}
+    summary = None
+    # random number streams of this run
+    seed = 1
+    bit_generator = 'PCG64'
+    streams = {}
     def __init__(self, env, core_cls, dispatcher_cls, request_cls=Request, logger_cls=Logger):
         self.env = env
-        self.num_cores = NicSimulator.config['num_cores'].next()
-        self.sample_period = NicSimulator.config['sample_period'].next()
-        NicSimulator.num_requests = NicSimulator.config['num_requests'].next()
+        self.num_cores = next(NicSimulator.config['num_cores'])
+        self.num_nic_queues = get_param('num_nic_queues', 1)
+        # always read so that swept values stay aligned with the other parameters
+        lb_policy = get_param('lb_policy', 'random')
+        steal_policy = get_param('steal_policy', 'none')
+        steal_cost = get_param('steal_cost', 0)
+        steal_d = get_param('steal_d', 2)
+        if steal_policy != 'none' and steal_policy not in WorkStealer.policies:
+            print('ERROR: Unsupported steal_policy: {}'.format(steal_policy))
+            sys.exit(1)
+        self.sampled_cores = get_param('sampled_cores', 16)
+        self.memory_limit = get_param('memory_limit', 0)
+        self.sample_period = next(NicSimulator.config['sample_period'])
+        NicSimulator.num_requests = next(NicSimulator.config['num_requests'])
+        NicSimulator.completion_callbacks = []
+        NicSimulator.drop_callbacks = []
+        # bounded queues and deadline admission (all optional)
+        queue_capacity = get_param('queue_capacity', 0)
+        core_queue_capacity = get_param('core_queue_capacity', 0)
+        drop_policy = get_param('drop_policy', 'tail')
+        NicSimulator.slo = get_param('slo', 0)
+        load_model = get_param('load_model', 'open')
+        if load_model not in ['open', 'closed']:
+            print('ERROR: Unsupported load_model: {}'.format(load_model))
+            sys.exit(1)
+        if self.num_cores % self.num_nic_queues != 0:
+            print('ERROR: num_cores ({}) must be a multiple of num_nic_queues ({})'.format(self.num_cores, self.num_nic_queues))
+            sys.exit(1)
         self.logger = logger_cls(env)
-        self.dispatcher = dispatcher_cls(self.env, self.logger)
-        self.generator = LoadGenerator(self.env, self.logger, self.dispatcher.queue, request_cls)
+        self.init_resources()
+        # one dispatcher per NIC queue, requests are spread across them by a top-level load balancer
+        self.dispatchers = [dispatcher_cls(self.env, self.logger) for i in range(self.num_nic_queues)]
+        if self.num_nic_queues > 1:
+            self.balancer = LoadBalancer(self.env, self.logger, self.dispatchers, lb_policy)
+            entry_queue = self.balancer.queue
+        else:
+            self.balancer = None
+            entry_queue = self.dispatchers[0].queue
+        generator_cls = ClosedLoopClients if load_model == 'closed' else LoadGenerator
+        self.generator = generator_cls(self.env, self.logger, entry_queue, request_cls)
 
         Request.count = 0
         Core.count = 0
 
-        # create cores
-        self.cores = []
-        for i in range(self.num_cores):
-            self.cores.append(core_cls(self.env, self.logger, self.dispatcher))
+        # create a group of cores for each dispatcher
+        self.core_groups = []
+        for d in self.dispatchers:
+            group = [core_cls(self.env, self.logger, d) for i in range(self.num_cores//self.num_nic_queues)]
+            # connect cores to dispatcher
+            d.add_cores(group)
+            if steal_policy != 'none':
+                d.stealer = WorkStealer(self.env, self.logger, group, steal_policy, steal_cost, steal_d)
+            self.core_groups.append(group)
+        self.cores = [c for group in self.core_groups for c in group]
+
+        # queues are bounded once all components have created them, since policies may override them
+        if queue_capacity > 0:
+            for d in self.dispatchers:
+                NicSimulator.bound_queue(d.queue, queue_capacity, drop_policy)
+        if core_queue_capacity > 0:
+            for c in self.cores:
+                NicSimulator.bound_queue(c.queue, core_queue_capacity, drop_policy, c.dropped)
 
-        # connect cores to dispatcher
-        self.dispatcher.add_cores(self.cores)
-        
         self.init_sim()
 
+    @staticmethod
+    def bound_queue(queue, capacity, drop_policy, listener=None):
+        """Bound a dispatcher or core queue, which must be a WatchedStore (or one of its subclasses)"""
+        if not isinstance(queue, WatchedStore):
+            print('ERROR: Bounded queues need a WatchedStore or WatchedPriorityStore, found a {}'.format(type(queue).__name__))
+            sys.exit(1)
+        queue.bound(capacity, drop_policy, listener)
+
+    def init_resources(self):
+        """Create the shared PCIe link and memory channel if their bandwidth is configured"""
+        NicSimulator.pcie = None
+        NicSimulator.mem = None
+        pcie_bw = get_param('pcie_bw', 0)
+        pcie_sharing = get_param('pcie_sharing', 'fair')
+        pcie_latency = get_param('pcie_latency', 0)
+        mem_bw = get_param('mem_bw', 0)
+        mem_sharing = get_param('mem_sharing', 'fair')
+        if pcie_bw > 0:
+            NicSimulator.pcie = SharedLink(self.env, 'pcie', pcie_bw, pcie_sharing, pcie_latency)
+        if mem_bw > 0:
+            NicSimulator.mem = SharedLink(self.env, 'mem', mem_bw, mem_sharing)
+        self.resources = [r for r in [NicSimulator.pcie, NicSimulator.mem] if r is not None]
+        NicSimulator.dma_bytes_dist = config_dist('dma_bytes', NicSimulator.rng('dma_bytes')) if 'dma_bytes' in NicSimulator.config else None
+        NicSimulator.mem_bytes_dist = config_dist('mem_bytes', NicSimulator.rng('mem_bytes')) if 'mem_bytes' in NicSimulator.config else None
+
+    @staticmethod
+    def add_demands(msg):
+        """Draw the request's demands on the shared resources"""
+        if NicSimulator.dma_bytes_dist is not None:
+            msg.dma_bytes = next(NicSimulator.dma_bytes_dist)
+        if NicSimulator.mem_bytes_dist is not None:
+            msg.mem_bytes = next(NicSimulator.mem_bytes_dist)
+        return msg
+
     def init_sim(self):
         # initialize run local variables
-        self.q_sizes = {c.ID:[] for c in self.cores}
-        self.q_sizes['time'] = []
-        self.q_sizes['dispatcher'] = []
+        # only a bounded number of cores is sampled individually so that the cost of sampling
+        # does not grow with num_cores, the aggregate occupancy of each group is always recorded
+        self.sampled = self.cores[:self.sampled_cores]
+        self.init_recorders()
+        self.q_sizes = {c.ID:NicSimulator.recorder(c.ID) for c in self.sampled}
+        self.q_sizes['time'] = NicSimulator.recorder('time')
+        for i in range(self.num_nic_queues):
+            self.q_sizes[self.group_name('dispatcher', i)] = NicSimulator.recorder(self.group_name('dispatcher', i))
+            self.q_sizes[self.group_name('cores', i)] = NicSimulator.recorder(self.group_name('cores', i))
         NicSimulator.complete = False
         NicSimulator.request_cnt = 0
+        NicSimulator.drop_cnt = 0
+        NicSimulator.drops = {'tail':0, 'head':0, 'deadline':0}
+        NicSimulator.slo_cnt = 0
+        NicSimulator.service_time_sum = 0
         NicSimulator.finish_time = 0
-        NicSimulator.completion_times = {'all':[]}
-        NicSimulator.service_times = {'all':[]}
-        NicSimulator.arrival_delays = {'all':[]}
+        NicSimulator.completion_times = {'all':NicSimulator.recorder('completion_times')}
+        NicSimulator.phase_completion_times = {}
+        NicSimulator.service_times = {'all':NicSimulator.recorder('service_times')}
+        NicSimulator.arrival_delays = {'all':NicSimulator.recorder('arrival_delays')}
         # start generating requests
         self.env.process(self.generator.start())
         # start logging
         if self.sample_period > 0:
             self.env.process(self.sample_queues())
+        if NicSimulator.progress > 0:
+            self.env.process(ProgressMonitor(self.env, NicSimulator.progress, NicSimulator.progress_file).start())
+
+    def init_recorders(self):
+        """Size the recorders of this run. With a memory_limit (MB), the budget is split between the
+        recorders and each one spills its samples to disk in chunks that fit its share.
+        """
+        NicSimulator.recorders = []
+        NicSimulator.chunk_size = 65536
+        NicSimulator.spill_dir = None
+        if self.memory_limit > 0:
+            process = self.generator.arrival_process
+            num_phases = 0 if process is None else 2 if process['type'] == 'onoff' else len(process['mean_delays'])
+            num_recorders = len(self.sampled) + 1 + 2*self.num_nic_queues + 3 + num_phases
+            # a pending sample costs about 40 bytes (list slot + boxed number), a packed one 8 bytes
+            NicSimulator.chunk_size = max(int(self.memory_limit*2**20/(48*num_recorders)), 1024)
+            NicSimulator.spill_dir = os.path.join(os.getcwd(), NicSimulator.out_run_dir, 'spill')
+            if not os.path.exists(NicSimulator.spill_dir):
+                os.makedirs(NicSimulator.spill_dir)
+
+    @staticmethod
+    def recorder(name):
+        """New Recorder for this run, spilling to disk in memory-bounded mode"""
+        spill_file = None
+        if NicSimulator.spill_dir is not None:
+            spill_file = os.path.join(NicSimulator.spill_dir, '{}-{}.bin'.format(len(NicSimulator.recorders), name))
+        r = Recorder(NicSimulator.chunk_size, spill_file)
+        if NicSimulator.profiler is not None:
+            # append is too cheap and too frequent to wrap, the packing and spilling is charged at flush
+            r.flush = NicSimulator.profiler.call(('Recorder', name, 'flush'), r.flush)
+        NicSimulator.recorders.append(r)
+        return r
+
+    @staticmethod
+    def profiled(name, iterator):
+        """Charge the time spent drawing from the iterator (e.g. a DistGenerator) to name when profiling"""
+        if NicSimulator.profiler is None:
+            return iterator
+        return NicSimulator.profiler.iterate(('DistGenerator', name, 'next'), iterator)
+
+    def group_name(self, name, i):
+        return name if self.num_nic_queues == 1 else '{}-{}'.format(name, i)
 
     def sample_queues(self):
         """Sample avg core queue occupancy at every time"""
+        columns = [(self.q_sizes[self.group_name('dispatcher', i)], self.q_sizes[self.group_name('cores', i)], d)
+                   for i, d in enumerate(self.dispatchers)]
         while not NicSimulator.complete:
             self.q_sizes['time'].append(self.env.now)
-            self.q_sizes['dispatcher'].append(len(self.dispatcher.queue.items))
-            for c in self.cores:
+            for dispatcher_col, cores_col, d in columns:
+                dispatcher_col.append(len(d.queue.items))
+                cores_col.append(d.core_occupancy.count)
+            for c in self.sampled:
                 self.q_sizes[c.ID].append(len(c.queue.items))
             yield self.env.timeout(self.sample_period)
 
+    @staticmethod
+    def rng(name):
+        """The random number stream of the named component (e.g. 'arrivals', 'service', 'dispatch').
+        Each component gets an independent stream derived from the run's seed, so randomness added to
+        one component (e.g. a dispatch policy) does not change the draws seen by the others.
+        """
+        if name not in NicSimulator.streams:
+            seq = np.random.SeedSequence(NicSimulator.seed, spawn_key=(zlib.crc32(name.encode()),))
+            bit_generator = getattr(np.random, NicSimulator.bit_generator)(seq)
+            NicSimulator.streams[name] = RandomStream(np.random.Generator(bit_generator))
+        return NicSimulator.streams[name]
+
+    @staticmethod
+    def admit(msg, service_time):
+        """Deadline-based admission control: reject a request whose predicted wait exceeds the slo.
+        The wait is predicted from the number of requests in the system and the mean service time so far.
+        """
+        NicSimulator.service_time_sum += service_time
+        if NicSimulator.slo <= 0:
+            return True
+        ahead = Request.count - 1 - NicSimulator.request_cnt - NicSimulator.drop_cnt
+        num_cores = Core.count
+        mean_service_time = float(NicSimulator.service_time_sum)/Request.count
+        wait = max(ahead - num_cores + 1, 0)*mean_service_time/num_cores
+        if wait > NicSimulator.slo:
+            NicSimulator.request_dropped(msg, msg.start_time, 'deadline')
+            return False
+        return True
+
+    @staticmethod
+    def request_dropped(msg, now, reason):
+        """Record a request that was dropped before completing"""
+        NicSimulator.drop_cnt += 1
+        NicSimulator.drops[reason] += 1
+        for callback in NicSimulator.drop_callbacks:
+            callback(msg, now)
+        NicSimulator.check_done(now)
+
+    @staticmethod
+    def request_done(msg, now):
+        """Record the completion of a request"""
+        latency = now - msg.start_time
+        NicSimulator.completion_times['all'].append(latency)
+        if latency <= NicSimulator.slo:
+            NicSimulator.slo_cnt += 1
+        if msg.phase is not None:
+            if msg.phase not in NicSimulator.phase_completion_times:
+                NicSimulator.phase_completion_times[msg.phase] = NicSimulator.recorder('phase-{}'.format(msg.phase))
+            NicSimulator.phase_completion_times[msg.phase].append(latency)
+        NicSimulator.request_cnt += 1
+        for callback in NicSimulator.completion_callbacks:
+            callback(msg, now)
+        NicSimulator.check_done(now)
+
+    @staticmethod
+    def on_completion(callback):
+        """Call callback(request, time) whenever a request completes during this run"""
+        NicSimulator.completion_callbacks.append(callback)
+
+    @staticmethod
+    def on_drop(callback):
+        """Call callback(request, time) whenever a request is dropped during this run"""
+        NicSimulator.drop_callbacks.append(callback)
+
     @staticmethod
     def check_done(now):
-        if NicSimulator.request_cnt == NicSimulator.num_requests:
+        if NicSimulator.request_cnt + NicSimulator.drop_cnt == NicSimulator.num_requests:
             NicSimulator.complete = True
             NicSimulator.finish_time = now
 
@@ -267,31 +1640,77 @@ class NicSimulator(object):
             os.makedirs(out_dir)
 
         # log the measured avg queue sizes
-        df = pd.DataFrame(self.q_sizes)
-        write_csv(df, os.path.join(NicSimulator.out_run_dir, 'q_sizes.csv'))
+        write_recorders(self.q_sizes, os.path.join(NicSimulator.out_run_dir, 'q_sizes.csv'))
 
         # log the measured request completion times
-        df = pd.DataFrame(NicSimulator.completion_times)*1e-3 # microseconds
-        write_csv(df, os.path.join(NicSimulator.out_run_dir, 'completion_times.csv'))
+        write_recorders(NicSimulator.completion_times, os.path.join(NicSimulator.out_run_dir, 'completion_times.csv'), 1e-3) # microseconds
 
         # log the generated service times
-        df = pd.DataFrame(NicSimulator.service_times) # nanoseconds
-        write_csv(df, os.path.join(NicSimulator.out_run_dir, 'service_times.csv'))
+        write_recorders(NicSimulator.service_times, os.path.join(NicSimulator.out_run_dir, 'service_times.csv')) # nanoseconds
 
         # log the generated arrival delays
-        df = pd.DataFrame(NicSimulator.arrival_delays) # nanoseconds
-        write_csv(df, os.path.join(NicSimulator.out_run_dir, 'arrival_delays.csv'))
+        write_recorders(NicSimulator.arrival_delays, os.path.join(NicSimulator.out_run_dir, 'arrival_delays.csv')) # nanoseconds
+
+        # log the load on the shared resources
+        if len(self.resources) > 0:
+            df = pd.DataFrame({'resource': [r.name for r in self.resources],
+                               'bytes': [r.bytes for r in self.resources],
+                               'utilization': [r.utilization(NicSimulator.finish_time) for r in self.resources]})
+            write_csv(df, os.path.join(NicSimulator.out_run_dir, 'resources.csv'))
+
+        # log latency stats for each phase of the arrival process
+        if len(NicSimulator.phase_completion_times) > 0:
+            phases = sorted(NicSimulator.phase_completion_times)
+            latencies = [NicSimulator.phase_completion_times[p] for p in phases]
+            df = pd.DataFrame({'phase': phases,
+                               'count': [len(l) for l in latencies],
+                               'avg': [l.mean()*1e-3 for l in latencies], # microseconds
+                               '50pc': [l.percentile(50)*1e-3 for l in latencies],
+                               '90pc': [l.percentile(90)*1e-3 for l in latencies],
+                               '99pc': [l.percentile(99)*1e-3 for l in latencies]})
+            write_csv(df, os.path.join(NicSimulator.out_run_dir, 'phase_completion_times.csv'))
 
         # record tail latencies for this run
-        tail99 = np.percentile(NicSimulator.completion_times['all'], 99)*1e-3 # microseconds
-        tail90 = np.percentile(NicSimulator.completion_times['all'], 90)*1e-3 # microseconds
+        tail99 = NicSimulator.completion_times['all'].percentile(99)*1e-3 # microseconds
+        tail90 = NicSimulator.completion_times['all'].percentile(90)*1e-3 # microseconds
         NicSimulator.tail_completion_times['99pc'].append(tail99)
         NicSimulator.tail_completion_times['90pc'].append(tail90)
 
-        # record avg throughput for this run
-        throughput = float(NicSimulator.num_requests)*1e3/(NicSimulator.finish_time) # MRPS
+        # record avg throughput for this run, dropped requests do not count
+        throughput = float(NicSimulator.request_cnt)*1e3/(NicSimulator.finish_time) # MRPS
         NicSimulator.avg_throughput['all'].append(throughput)
 
+        # record losses for this run, goodput only counts requests that met the slo (if any)
+        good = NicSimulator.slo_cnt if NicSimulator.slo > 0 else NicSimulator.request_cnt
+        df = pd.DataFrame({'reason': list(NicSimulator.drops), 'count': list(NicSimulator.drops.values())})
+        write_csv(df, os.path.join(NicSimulator.out_run_dir, 'drops.csv'))
+        NicSimulator.drop_stats['dropped'].append(NicSimulator.drop_cnt)
+        NicSimulator.drop_stats['drop_rate'].append(float(NicSimulator.drop_cnt)/NicSimulator.num_requests)
+        NicSimulator.drop_stats['goodput'].append(float(good)*1e3/(NicSimulator.finish_time)) # MRPS
+
+        # summary metrics for the results catalog
+        latencies = NicSimulator.completion_times['all']
+        NicSimulator.summary = collections.OrderedDict([
+            ('completed', NicSimulator.request_cnt),
+            ('dropped', NicSimulator.drop_cnt),
+            ('drop_rate', NicSimulator.drop_stats['drop_rate'][-1]),
+            ('avg', latencies.mean()*1e-3), # microseconds
+            ('50pc', latencies.percentile(50)*1e-3),
+            ('90pc', tail90),
+            ('99pc', tail99),
+            ('99.9pc', latencies.percentile(99.9)*1e-3),
+            ('throughput', throughput),
+            ('goodput', NicSimulator.drop_stats['goodput'][-1]),
+            ('finish_time', NicSimulator.finish_time*1e-3), # microseconds
+        ])
+
+        # release the recorders and their spill files
+        for r in NicSimulator.recorders:
+            r.close()
+        NicSimulator.recorders = []
+        if NicSimulator.spill_dir is not None:
+            shutil.rmtree(NicSimulator.spill_dir)
+
     @staticmethod
     def dump_global_logs():
         # log tail completion_times
@@ -302,10 +1721,95 @@ class NicSimulator(object):
         df = pd.DataFrame(NicSimulator.avg_throughput)
         write_csv(df, os.path.join(NicSimulator.out_dir, 'avg_throughput.csv'))
 
+        # log drops and goodput
+        df = pd.DataFrame(NicSimulator.drop_stats)
+        write_csv(df, os.path.join(NicSimulator.out_dir, 'drops.csv'))
+
+class ResultsCatalog:
+    """SQLite index of finished runs, holding the value of every parameter each run used and its
+    summary metrics, so that results can be compared across experiments without loading the raw
+    per-request logs, e.g. the p99 latency vs. comm_delay of JBSQ on 4 cores:
+
+        ResultsCatalog('results.db').query('99pc', 'comm_delay', policy='JBSQ', num_cores=4)
+
+    Parameter values are stored as JSON, so filters must match the type used in the config
+    (e.g. 4 does not match 4.0).
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, policy TEXT, out_dir TEXT, run INTEGER,
+                                         config TEXT, finished TEXT, wall_sec REAL);
+        CREATE TABLE IF NOT EXISTS params (run_id INTEGER, name TEXT, value TEXT, PRIMARY KEY (run_id, name));
+        CREATE TABLE IF NOT EXISTS metrics (run_id INTEGER, name TEXT, value REAL, PRIMARY KEY (run_id, name));
+        CREATE INDEX IF NOT EXISTS params_by_value ON params (name, value);
+    """
+
+    def __init__(self, filename):
+        # several simulations may record into the same catalog concurrently
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.executescript(ResultsCatalog.schema)
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value, sort_keys=True)
+
+    def add_run(self, policy, out_dir, run, config, wall_sec, params, metrics):
+        """Record a finished run, returns its id"""
+        with self.db:
+            cur = self.db.execute('INSERT INTO runs (policy, out_dir, run, config, finished, wall_sec) VALUES (?, ?, ?, ?, ?, ?)',
+                                  (policy, out_dir, run, config, time.strftime('%Y-%m-%d %H:%M:%S'), wall_sec))
+            run_id = cur.lastrowid
+            self.db.executemany('INSERT INTO params VALUES (?, ?, ?)',
+                                [(run_id, name, ResultsCatalog.encode(value)) for name, value in params.items()])
+            self.db.executemany('INSERT INTO metrics VALUES (?, ?, ?)',
+                                [(run_id, name, float(value)) for name, value in metrics.items()])
+        return run_id
+
+    def runs(self, policy=None, **where):
+        """DataFrame with one row per run matching the policy and parameter values, holding the run's
+        parameters and metrics as columns
+        """
+        conds = []
+        args = []
+        if policy is not None:
+            conds.append('policy = ?')
+            args.append(policy)
+        for name, value in where.items():
+            conds.append('id IN (SELECT run_id FROM params WHERE name = ? AND value = ?)')
+            args += [name, ResultsCatalog.encode(value)]
+        ids = 'SELECT id FROM runs' + (' WHERE ' + ' AND '.join(conds) if len(conds) > 0 else '')
+        runs = pd.read_sql_query('SELECT * FROM runs WHERE id IN ({}) ORDER BY id'.format(ids), self.db, params=args, index_col='id')
+        params = pd.read_sql_query('SELECT * FROM params WHERE run_id IN ({})'.format(ids), self.db, params=args)
+        metrics = pd.read_sql_query('SELECT * FROM metrics WHERE run_id IN ({})'.format(ids), self.db, params=args)
+        params['value'] = params['value'].map(json.loads)
+        for df in [params, metrics]:
+            if len(df) > 0:
+                runs = runs.join(df.pivot(index='run_id', columns='name', values='value'), rsuffix='_')
+        return runs
+
+    def query(self, metric, param, policy=None, **where):
+        """metric (e.g. '99pc') vs. param (e.g. 'comm_delay') for the matching runs, per policy"""
+        df = self.runs(policy, **where)
+        if len(df) == 0:
+            return pd.DataFrame(columns=['policy', param, metric])
+        return df[['policy', param, metric]].sort_values(['policy', param]).reset_index(drop=True)
+
+    def close(self):
+        self.db.close()
+
 def write_csv(df, filename):
     with open(filename, 'w') as f:
             f.write(df.to_csv(index=False))
 
+def write_recorders(columns, filename, scale=None):
+    """Write a dict of equally long Recorders as the columns of a CSV file, a block of rows at a time"""
+    with open(filename, 'w') as f:
+        f.write(','.join(str(name) for name in columns) + '\n')
+        for blocks in zip(*[r.blocks() for r in columns.values()]):
+            df = pd.DataFrame(dict(zip(columns, blocks)))
+            if scale is not None:
+                df = df*scale
+            f.write(df.to_csv(index=False, header=False))
+
 def param(x):
     while True:
         yield x
@@ -314,47 +1818,97 @@ def param_list(L):
     for x in L:
         yield x
 
+def recorded(name, values):
+    """Remember the values of a parameter as they are used by the current run"""
+    for x in values:
+        NicSimulator.run_params[name] = x
+        yield x
+
+def get_param(name, default):
+    """Next value of an optional config parameter"""
+    if name in NicSimulator.config:
+        return next(NicSimulator.config[name])
+    NicSimulator.run_params[name] = default
+    return default
+
 def parse_config(config_file):
     """ Convert each parameter in the JSON config file into a generator
     """
     with open(config_file) as f:
         config = json.load(f)
 
-    for p, val in config.iteritems():
+    for p, val in config.items():
         if type(val) == list:
-            config[p] = param_list(val)
+            config[p] = recorded(p, param_list(val))
         else:
-            config[p] = param(val)
+            config[p] = recorded(p, param(val))
 
     return config
 
-def run_nic_sim(cmdline_args, *args):
+def policy_name(dispatcher_cls):
+    """Name of the policy implemented by a dispatcher class, e.g. JBSQ for JBSQDispatcher"""
+    name = dispatcher_cls.__name__
+    return name[:-len('Dispatcher')] if name.endswith('Dispatcher') and name != 'Dispatcher' else name
+
+def run_nic_sim(cmdline_args, *args, policy=None):
+    """Run every simulation in the config with the given core, dispatcher (and request) classes.
+    The policy recorded in the results catalog defaults to the name of the dispatcher class.
+    """
     NicSimulator.config = parse_config(cmdline_args.config)
+    NicSimulator.progress = cmdline_args.progress
+    NicSimulator.progress_file = cmdline_args.progress_file
     # make sure output directory exists
-    NicSimulator.out_dir = NicSimulator.config['out_dir'].next()
+    NicSimulator.out_dir = next(NicSimulator.config['out_dir'])
     out_dir = os.path.join(os.getcwd(), NicSimulator.out_dir)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
     # copy config file into output directory
-    os.system('cp {} {}'.format(cmdline_args.config, out_dir))
+    shutil.copy(cmdline_args.config, out_dir)
+    catalog = ResultsCatalog(cmdline_args.results_db) if cmdline_args.results_db is not None else None
+    if policy is None:
+        policy = policy_name(args[1])
     # run the simulations
     run_cnt = 0
     try:
         while True:
-            print 'Running simulation {} ...'.format(run_cnt)
-            # initialize random seed
-            random.seed(1)
-            np.random.seed(1)
+            print('Running simulation {} ...'.format(run_cnt))
+            start_wall = time.time()
+            NicSimulator.run_params = {}
+            # every run starts from the same seed so that runs see the same workload
+            NicSimulator.seed = get_param('seed', 1)
+            NicSimulator.bit_generator = get_param('bit_generator', 'PCG64')
+            NicSimulator.streams = {}
             # init params for this run on all classes
             for cls in args:
                 cls.init_params()
             NicSimulator.out_run_dir = os.path.join(NicSimulator.out_dir, 'run-{}'.format(run_cnt))
             run_cnt += 1
-            env = simpy.Environment()
+            if cmdline_args.profile:
+                NicSimulator.profiler = Profiler()
+                env = ProfiledEnvironment(NicSimulator.profiler)
+            else:
+                env = simpy.Environment()
             s = NicSimulator(env, *args)
+            if NicSimulator.profiler is not None:
+                NicSimulator.profiler.start()
+            if cmdline_args.cprofile:
+                cprofile = cProfile.Profile()
+                cprofile.enable()
             env.run()
+            if cmdline_args.cprofile:
+                cprofile.disable()
+            if NicSimulator.profiler is not None:
+                NicSimulator.profiler.stop()
             s.dump_run_logs()
+            if cmdline_args.cprofile:
+                cprofile.dump_stats(os.path.join(NicSimulator.out_run_dir, 'cprofile.prof'))
+            if NicSimulator.profiler is not None:
+                NicSimulator.profiler.dump(NicSimulator.out_run_dir, env.steps)
+                NicSimulator.profiler = None
+            if catalog is not None:
+                catalog.add_run(policy, NicSimulator.out_dir, run_cnt - 1, os.path.abspath(cmdline_args.config),
+                                time.time() - start_wall, NicSimulator.run_params, NicSimulator.summary)
     except StopIteration:
         NicSimulator.dump_global_logs()
-        print 'All Simulations Complete!'
+        print('All Simulations Complete!')
 
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from nic_sim_lib import ArrivalProcess
+
+
+class CountingGenerator:
+    """Wraps a numpy Generator, counting the exponentials drawn"""
+    def __init__(self, seed):
+        self.gen = np.random.default_rng(seed)
+        self.drawn = 0
+
+    def exponential(self, scale, size=None):
+        self.drawn += 1 if size is None else size
+        return self.gen.exponential(scale, size)
+
+
+class Stream:
+    def __init__(self, generator):
+        self.generator = generator
+
+
+def draw(spec, n, seed=1):
+    arrivals = CountingGenerator(seed)
+    process = ArrivalProcess(spec, Stream(arrivals), Stream(np.random.default_rng(seed + 1)))
+    samples = [next(process) for i in range(n)]
+    return samples, arrivals.drawn
+
+
+def test_short_sojourns_do_not_waste_draws():
+    # about two arrivals per state visit
+    spec = {'type': 'mmpp', 'names': ['a', 'b'], 'mean_delays': [1000, 500], 'mean_sojourns': [2000, 1000]}
+    samples, drawn = draw(spec, 20000)
+    assert drawn < 2*len(samples) + 4096
+
+
+@pytest.mark.parametrize('kind', ['mmpp', 'piecewise'])
+def test_phase_rates(kind):
+    if kind == 'mmpp':
+        spec = {'type': 'mmpp', 'names': ['calm', 'burst'], 'mean_delays': [2000, 500], 'mean_sojourns': [20000, 20000]}
+    else:
+        spec = {'type': 'piecewise', 'names': ['calm', 'burst'], 'mean_delays': [2000, 500], 'durations': [20000, 20000]}
+    samples, drawn = draw(spec, 50000)
+    counts = {name: sum(1 for d, p in samples if p == name) for name in ['calm', 'burst']}
+    # both states last equally long on average, so the burst state sees about 4 times the arrivals
+    assert counts['burst']/counts['calm'] == pytest.approx(4, rel=0.1)
+    total = sum(d for d, p in samples)
+    assert total/len(samples) == pytest.approx(2/(1/2000 + 1/500), rel=0.05)
@@ -0,0 +1,14 @@
+import simpy
+
+from nic_sim_lib import ProgressMonitor
+
+
+def test_events_does_not_draw_event_ids():
+    env = simpy.Environment()
+    monitor = ProgressMonitor(env, 1)
+    for i in range(5):
+        env.timeout(i)
+    assert monitor.events() == 5
+    assert monitor.events() == 5
+    env.timeout(0)
+    assert monitor.events() == 6
@@ -0,0 +1,24 @@
+import collections
+
+import numpy as np
+import pytest
+
+from nic_sim_lib import RandomStream
+
+
+@pytest.mark.parametrize('n, k', [(4, 2), (4, 4), (8, 3)])
+def test_sample_breaks_ties_uniformly(n, k):
+    rng = RandomStream(np.random.default_rng(1))
+    seq = list(range(n))
+    draws = 40000
+    # min() keeps the first of equal elements, i.e. the first one sampled
+    firsts = collections.Counter(min(rng.sample(seq, k), key=lambda x: 0) for i in range(draws))
+    for x in seq:
+        assert firsts[x]/draws == pytest.approx(1.0/n, abs=0.02)
+
+
+def test_sample_is_distinct():
+    rng = RandomStream(np.random.default_rng(2))
+    for i in range(1000):
+        picked = rng.sample(list(range(10)), 4)
+        assert len(set(picked)) == 4
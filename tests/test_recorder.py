@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from nic_sim_lib import Recorder
+
+MIXED = [1, 2, 3, 4, 5.5, 6.75, 7.25, 8.9, 9.5]
+
+
+@pytest.fixture(params=['memory', 'spill'])
+def recorder(request, tmp_path):
+    spill_file = str(tmp_path/'mixed.bin') if request.param == 'spill' else None
+    r = Recorder(chunk_size=4, spill_file=spill_file)
+    yield r
+    r.close()
+
+
+def test_mixed_int_float_column(recorder):
+    for x in MIXED:
+        recorder.append(x)
+    assert len(recorder) == len(MIXED)
+    assert np.concatenate(list(recorder.blocks())).tolist() == MIXED
+    assert recorder.mean() == pytest.approx(np.mean(MIXED))
+    assert recorder.dtype == np.float64
+
+
+def test_int_column_stays_int(recorder):
+    for x in range(10):
+        recorder.append(x)
+    values = np.concatenate(list(recorder.blocks()))
+    assert values.dtype == np.int64
+    assert values.tolist() == list(range(10))
+
+
+def test_blocks_from_offset(recorder):
+    for x in MIXED:
+        recorder.append(x)
+    assert np.concatenate(list(recorder.blocks(3))).tolist() == MIXED[3:]
+
+
+def test_rejects_incompatible_samples(recorder):
+    for x in range(4):
+        recorder.append(x)
+    with pytest.raises(ValueError):
+        for x in ['a']*4:
+            recorder.append(x)
@@ -0,0 +1,70 @@
+import importlib
+import json
+
+import pandas as pd
+import pytest
+
+from nic_sim_lib import cmd_parser, Core, NicSimulator, PreemptiveRequest, run_nic_sim
+
+# serve_preemptive matches the per-quantum loop except for ties: a request put into a watched queue at
+# the exact time of a quantum boundary, or two cores reaching a boundary at the same time, where the
+# order of the simultaneous events depends on when they were scheduled. The fractional quantum and comm
+# delay keep the boundaries off the integer arrival times, and this seed has no ties between cores.
+CONFIG = {
+    'num_cores': 4,
+    'num_requests': 1000,
+    'service_time': 'bimodal',
+    'service_time_lower_mean': 1000,
+    'service_time_lower_stddev': 100,
+    'service_time_lower_samples': 900,
+    'service_time_upper_mean': 50000,
+    'service_time_upper_stddev': 1000,
+    'service_time_upper_samples': 100,
+    'arrival_delay': 'poisson',
+    'arrival_delay_lambda': [2000, 1200],
+    'sample_period': 0,
+    'comm_delay': 200.37,
+    'preemp': 500.113,
+    'seed': 7,
+}
+
+
+def serve_per_quantum(self, msg, preempt, watched):
+    """The per-quantum loop that serve_preemptive replaced: wake up at every quantum boundary"""
+    if NicSimulator.pcie is not None:
+        yield from self.fetch(msg)
+    yield self.env.timeout(msg.runtime)
+    msg.advance(msg.runtime)
+    while msg.runtime > 0 and not preempt():
+        yield self.env.timeout(msg.runtime)
+        msg.advance(msg.runtime)
+    if msg.runtime > 0:
+        msg.preempt()
+        if PreemptiveRequest.ctx_switch_cost > 0:
+            yield self.env.timeout(PreemptiveRequest.ctx_switch_cost)
+
+
+def completion_times(tmp_path, policy, out_dir):
+    config = dict(CONFIG, out_dir=out_dir)
+    filename = str(tmp_path / '{}.json'.format(out_dir))
+    with open(filename, 'w') as f:
+        json.dump(config, f)
+    sim = importlib.import_module('{}_sim'.format(policy))
+    core = getattr(sim, '{}Core'.format(policy))
+    dispatcher = getattr(sim, '{}Dispatcher'.format(policy))
+    run_nic_sim(cmd_parser.parse_args(['--config', filename]), core, dispatcher, PreemptiveRequest)
+    return [pd.read_csv(str(tmp_path / out_dir / 'run-{}'.format(i) / 'completion_times.csv'))
+            for i in range(len(CONFIG['arrival_delay_lambda']))]
+
+
+@pytest.mark.parametrize('policy', ['cPRE', 'dPRE'])
+def test_matches_per_quantum_loop(tmp_path, monkeypatch, policy):
+    monkeypatch.chdir(tmp_path)
+    new = completion_times(tmp_path, policy, 'new')
+    monkeypatch.setattr(Core, 'serve_preemptive', serve_per_quantum)
+    old = completion_times(tmp_path, policy, 'old')
+    for a, b in zip(old, new):
+        assert len(a) == CONFIG['num_requests']
+        # the quantum boundaries are summed in a different order, so times may differ by rounding
+        pd.testing.assert_frame_equal(a.sort_values(list(a.columns)).reset_index(drop=True),
+                                      b.sort_values(list(b.columns)).reset_index(drop=True))
@@ -0,0 +1,75 @@
+import numpy as np
+import simpy
+import pytest
+
+from nic_sim_lib import SharedLink
+
+
+def run_transfers(link, env, sizes, gaps):
+    done = []
+
+    def source():
+        for nbytes, gap in zip(sizes, gaps):
+            ev = link.transfer(nbytes)
+            ev.callbacks.append(lambda event: done.append(env.now))
+            yield env.timeout(gap)
+
+    env.process(source())
+    return done
+
+
+@pytest.mark.parametrize('initial_time', [0, 1e9, 1e10, 1e12])
+def test_fair_link_completes_at_large_times(initial_time):
+    env = simpy.Environment(initial_time=initial_time)
+    link = SharedLink(env, 'pcie', 1.0, 'fair')
+    rng = np.random.default_rng(1)
+    n = 2000
+    done = run_transfers(link, env, rng.integers(100, 5000, n).tolist(), rng.exponential(1500, n).tolist())
+    steps = 0
+    while steps < 50*n:
+        try:
+            env.step()
+        except simpy.core.EmptySchedule:
+            break
+        steps += 1
+    assert len(done) == n
+    assert len(link.active) == 0
+    # every byte is transferred at the link bandwidth, so the link can not finish earlier
+    assert env.now - initial_time >= link.bytes/link.bandwidth*(1 - 1e-6)
+
+
+def test_fair_link_shares_bandwidth():
+    env = simpy.Environment()
+    link = SharedLink(env, 'mem', 2.0, 'fair')
+    finish = {}
+    for name, nbytes in [('small', 1000), ('large', 3000)]:
+        link.transfer(nbytes).callbacks.append(lambda event, name=name: finish.__setitem__(name, env.now))
+    env.run()
+    # both transfers get 1 B/ns until the small one is done, then the large one gets 2 B/ns
+    assert finish['small'] == pytest.approx(1000)
+    assert finish['large'] == pytest.approx(2000)
+
+
+@pytest.mark.parametrize('model', SharedLink.models)
+def test_latency_follows_transfer(model):
+    env = simpy.Environment()
+    link = SharedLink(env, 'pcie', 1.0, model, latency=500)
+    finish = []
+    link.transfer(1000).callbacks.append(lambda event: finish.append(env.now))
+    env.run()
+    assert finish == [pytest.approx(1500)]
+
+
+@pytest.mark.parametrize('model', SharedLink.models)
+def test_utilization_ignores_pending_timeouts(model):
+    utilizations = []
+    for pending in [0, 1e6]:
+        env = simpy.Environment()
+        link = SharedLink(env, 'pcie', 1.0, model)
+        done = run_transfers(link, env, [1000, 2000, 500], [1500, 4000, 0])
+        # e.g. a progress monitor tick or a stale preemption timer outliving the last request
+        env.timeout(pending)
+        env.run()
+        assert done == [pytest.approx(t) for t in [1000, 3500, 6000]]
+        utilizations.append(link.utilization(done[-1]))
+    assert utilizations == [pytest.approx(3500/6000.0)]*2